@@ -0,0 +1,28 @@
+"""Add loudness measurement to audios and videos
+
+Revision ID: 3f1b7c2e8a41
+Revises: 9c3242b53847
+Create Date: 2026-10-17 10:12:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1b7c2e8a41'
+down_revision: Union[str, Sequence[str], None] = '9c3242b53847'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('audios', sa.Column('loudness', sa.JSON, nullable=True))
+    op.add_column('videos', sa.Column('loudness', sa.JSON, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'loudness')
+    op.drop_column('audios', 'loudness')
@@ -0,0 +1,28 @@
+"""Add cached media info to audios and videos
+
+Revision ID: 5a8e0f3d6b12
+Revises: b7d24e91c5a0
+Create Date: 2026-10-17 13:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a8e0f3d6b12'
+down_revision: Union[str, Sequence[str], None] = 'b7d24e91c5a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('audios', sa.Column('media_info', sa.JSON, nullable=True))
+    op.add_column('videos', sa.Column('media_info', sa.JSON, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'media_info')
+    op.drop_column('audios', 'media_info')
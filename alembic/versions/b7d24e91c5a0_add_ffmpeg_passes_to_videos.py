@@ -0,0 +1,26 @@
+"""Add ffmpeg_passes to videos
+
+Revision ID: b7d24e91c5a0
+Revises: 3f1b7c2e8a41
+Create Date: 2026-10-17 11:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d24e91c5a0'
+down_revision: Union[str, Sequence[str], None] = '3f1b7c2e8a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('ffmpeg_passes', sa.Integer, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'ffmpeg_passes')
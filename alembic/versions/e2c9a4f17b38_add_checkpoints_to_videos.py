@@ -0,0 +1,26 @@
+"""Add processing checkpoints to videos
+
+Revision ID: e2c9a4f17b38
+Revises: 5a8e0f3d6b12
+Create Date: 2026-10-17 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c9a4f17b38'
+down_revision: Union[str, Sequence[str], None] = '5a8e0f3d6b12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('videos', sa.Column('checkpoints', sa.JSON, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('videos', 'checkpoints')
@@ -15,6 +15,8 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
+# Stream tokens only need to outlive opening the stream they were issued for.
+STREAM_TOKEN_EXPIRE_SECONDS = 60
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="/auth/login")
@@ -33,12 +35,38 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def create_stream_token(user: User, resource: str) -> str:
+    """
+    Short-lived token for one user to open one stream (e.g. "video:42"), for
+    clients like the browser's EventSource that can't send an Authorization
+    header and have to pass it in the URL instead.
+
+    It has no "sub", and get_current_user rejects scoped tokens, so a stream
+    token leaked from a URL or access log can't be used as a login token.
+    """
+    return create_access_token({"uid": user.id, "scope": "stream", "resource": resource},
+                               expires_delta=timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS))
+
+
+def verify_stream_token(token: str, resource: str) -> int:
+    """Returns the user id a stream token was issued to, if it is valid for `resource`."""
+    credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("scope") != "stream" or payload.get("resource") != resource or payload.get("uid") is None:
+        raise credentials_exception
+    return payload["uid"]
+
+
 def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], db: Session = Depends(get_db)):
     credentials_exception = HTTPException(status_code=401, detail="Could not validate credentials")
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
-        if not email:
+        # Scoped tokens (e.g. stream tokens) are only valid where their scope is checked.
+        if not email or payload.get("scope") is not None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
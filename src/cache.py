@@ -0,0 +1,28 @@
+import os
+from dotenv import load_dotenv
+import redis
+import redis.asyncio
+
+load_dotenv()
+
+# Defaults to the Celery broker, which is the Redis every service already reaches.
+REDIS_URL = os.getenv("REDIS_URL") or os.getenv("CELERY_BROKER_URL") or "redis://localhost:6379/0"
+
+_redis = None
+
+def get_redis() -> redis.Redis:
+    """Process-wide Redis client (connections are pooled and opened lazily)."""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _redis
+
+
+_async_redis = None
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """Process-wide asyncio Redis client, for the API's event loop (e.g. pub/sub streams)."""
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = redis.asyncio.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _async_redis
@@ -1,7 +1,7 @@
 import datetime
 
 from src.database import Base
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON
 from sqlalchemy.orm import relationship
 
 
@@ -19,6 +19,10 @@ class Audio(Base):
     status = Column(String, default="PENDING")
     summary = Column(String, nullable=True)
     error_message = Column(String, nullable=True)
+    # EBU R128 measurement of the original upload, reused by re-renders.
+    loudness = Column(JSON, nullable=True)
+    # MediaInfo of the original upload (see probe_media), so reruns skip ffprobe.
+    media_info = Column(JSON, nullable=True)
 
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="audios")
@@ -37,6 +41,14 @@ class Video(Base):
     status = Column(String, default="PENDING")
     summary = Column(String, nullable=True)
     error_message = Column(String, nullable=True)
+    # EBU R128 measurement of the original upload, reused by re-renders.
+    loudness = Column(JSON, nullable=True)
+    # MediaInfo of the original upload (see probe_media), so reruns skip ffprobe.
+    media_info = Column(JSON, nullable=True)
+    # Full FFmpeg decode/encode passes the last processing run made.
+    ffmpeg_passes = Column(Integer, nullable=True)
+    # Completed processing stages and their artifacts, so a retry resumes (see JobCheckpoints).
+    checkpoints = Column(JSON, nullable=True)
 
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="videos")
@@ -0,0 +1,265 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from functools import partial
+from pathlib import Path
+from typing import Callable
+from tempfile import TemporaryDirectory
+
+from dotenv import load_dotenv
+
+from src.media.service import get_media_duration, get_video_frame_rate
+from src.progress import report_progress
+
+load_dotenv()
+
+# Long timeline entries are split into segments of at most this length, so a
+# long A-roll stretch doesn't leave one worker busy while the rest sit idle.
+PARALLEL_SEGMENT_SECONDS = float(os.getenv("PARALLEL_SEGMENT_SECONDS", "10"))
+# Concurrent FFmpeg encodes. 0 means one per available core.
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0"))
+# Every segment is encoded with exactly these settings so they concat by stream copy.
+RENDER_PRESET = os.getenv("RENDER_PRESET", "ultrafast")
+RENDER_CRF = os.getenv("RENDER_CRF", "23")
+
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def split_timeline(timeline: list[dict], fps: str,
+                   max_seconds: float = PARALLEL_SEGMENT_SECONDS) -> list[dict]:
+    """
+    Splits timeline entries ({"source", "start", "end", ...}) into pieces no
+    longer than `max_seconds`, each an exact number of output frames ("frames").
+
+    Boundaries are snapped to the output frame grid by their position in the
+    whole timeline, so rounding never accumulates: the pieces add up to
+    round(total duration * fps) frames and the video stays in step with the
+    audio muxed under it.
+    """
+    rate = Fraction(fps)
+    max_frames = max(1, int(max_seconds * rate))
+    segments = []
+    position = 0.0
+    for entry in timeline:
+        start, end = entry["start"], entry["end"]
+        if end - start <= 0.001:
+            continue
+        first_frame = round(position * rate)
+        position += end - start
+        frames = round(position * rate) - first_frame
+        if frames <= 0:
+            continue
+        if entry.get("copy") or entry.get("rendition"):
+            # Copying is cheap, and a copied piece must start on the source's first keyframe.
+            segments.append({**entry, "frames": frames})
+            continue
+        pieces = max(1, frames // max_frames + (1 if frames % max_frames > rate / 2 else 0))
+        for i in range(pieces):
+            piece_start, piece_end = frames * i // pieces, frames * (i + 1) // pieces
+            segments.append({**entry, "start": start + float(piece_start / rate),
+                             "end": start + float(piece_end / rate), "frames": piece_end - piece_start})
+    return segments
+
+
+def _segment_command(segment: dict, out_path: Path, width: int, height: int, fps: str, threads: int) -> list[str]:
+    duration = segment["end"] - segment["start"]
+    # Timeline segments are cut by frame count (see split_timeline), renditions by time.
+    length = ["-frames:v", str(segment["frames"])] if "frames" in segment else ["-t", f"{duration:.6f}"]
+    if segment.get("copy"):
+        # Already encoded with these exact settings (e.g. a library rendition),
+        # and starting on a keyframe: the segment is just the leading packets.
+        return [
+            "ffmpeg", "-y",
+            "-i", segment["source"],
+            *length,
+            "-map", "0:v:0", "-an",
+            "-c:v", "copy",
+            "-f", "mpegts",
+            str(out_path)
+        ]
+    video_filter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad=width={width}:height={height}:x=-1:y=-1:color=black,"
+        f"setsar=1,fps={fps}"
+    )
+    if segment.get("hold_last_frame"):
+        # A B-roll clip shorter than its slot freezes on its last frame instead of
+        # ending early and pulling the rest of the video out of sync with the audio.
+        video_filter += f",tpad=stop_mode=clone:stop_duration={duration:.3f}"
+    elif "frames" in segment:
+        # A source ending a frame short of the grid still fills its frame count.
+        video_filter += ",tpad=stop_mode=clone:stop_duration=0.5"
+    return [
+        "ffmpeg", "-y",
+        "-ss", f"{segment['start']:.6f}", "-i", segment["source"],
+        *length,
+        "-map", "0:v:0", "-an",
+        "-vf", video_filter,
+        "-c:v", "libx264",
+        "-preset", RENDER_PRESET,
+        "-crf", RENDER_CRF,
+        "-pix_fmt", "yuv420p",
+        "-threads", str(threads),
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "mpegts",
+        str(out_path)
+    ]
+
+
+def encode_rendition(source: str, out_path: str, width: int, height: int, fps: str, max_seconds: float) -> str:
+    """
+    Encodes up to the first `max_seconds` of `source` with exactly the
+    settings segments are encoded with, so that any leading part of it can
+    later be used as a "copy" timeline entry at the same width/height/fps.
+    """
+    segment = {"source": source, "start": 0.0, "end": max_seconds}
+    cmd = _segment_command(segment, Path(out_path), width, height, fps, _available_cores())
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ FFmpeg rendition encode failed. Exit code: {e.returncode}")
+        print(f"FFmpeg stderr:\n{e.stderr}")
+        raise
+    return str(out_path)
+
+
+def rendition_key(width: int, height: int, fps: str) -> str:
+    """Identifies renditions interchangeable with segments encoded at these settings."""
+    return f"{width}x{height}_{fps.replace('/', '-')}_{RENDER_PRESET}_crf{RENDER_CRF}"
+
+
+def _resolve_rendition(segment: dict) -> dict:
+    """
+    A segment with a "rendition" lookup becomes a stream copy of that
+    rendition when it covers the whole segment; otherwise it is encoded as is.
+    """
+    rendition = segment["rendition"]() if segment.get("rendition") else None
+    if rendition and rendition[1] >= segment["end"] - segment["start"]:
+        return {"source": str(rendition[0]), "start": 0.0, "end": segment["end"] - segment["start"],
+                "frames": segment["frames"], "copy": True}
+    return segment
+
+
+def encode_segments_parallel(segments: list[dict], work_dir: str, width: int, height: int, fps: str,
+                             workers: int = RENDER_WORKERS) -> list[Path]:
+    """
+    Encodes each segment to its own MPEG-TS file, running up to `workers`
+    FFmpeg processes at once with the cores split evenly between them.
+    Returns the segment paths in timeline order.
+    """
+    cores = _available_cores()
+    workers = max(1, min(workers or cores, len(segments)))
+    threads = max(1, cores // workers)
+
+    def _encode(indexed):
+        index, segment = indexed
+        segment = _resolve_rendition(segment)
+        out_path = Path(work_dir) / f"segment_{index:05d}.ts"
+        try:
+            subprocess.run(_segment_command(segment, out_path, width, height, fps, threads),
+                           check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ FFmpeg segment {index} encode failed. Exit code: {e.returncode}")
+            print(f"FFmpeg stderr:\n{e.stderr}")
+            raise
+        return out_path
+
+    print(f"▶️ Encoding {len(segments)} segments with {workers} parallel FFmpeg workers "
+          f"({threads} thread(s) each)...")
+    total = sum(segment["end"] - segment["start"] for segment in segments)
+    done = 0.0
+    paths = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Results arrive in timeline order; progress is reported from this thread.
+        for segment, path in zip(segments, pool.map(_encode, enumerate(segments))):
+            done += segment["end"] - segment["start"]
+            report_progress(done, total)
+            paths.append(path)
+    return paths
+
+
+def render_timeline_parallel(timeline: list[dict], audio_source: str, output_path: str,
+                             width: int, height: int, fps: str) -> str:
+    """
+    Renders a video timeline by encoding independent segments concurrently,
+    joining them with the concat demuxer (stream copy), and muxing the audio
+    track of `audio_source` under the result.
+    """
+    segments = split_timeline(timeline, fps)
+    if not segments:
+        raise ValueError("Nothing to render: the timeline is empty.")
+
+    with TemporaryDirectory() as work_dir:
+        segment_paths = encode_segments_parallel(segments, work_dir, width, height, fps)
+
+        concat_list_path = Path(work_dir) / "concat_list.txt"
+        with open(concat_list_path, "w") as f:
+            for path in segment_paths:
+                f.write(f"file '{path.as_posix()}'\n")
+
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(concat_list_path),
+            "-i", audio_source,
+            "-map", "0:v", "-map", "1:a?",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-shortest",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            print(f"❌ FFmpeg segment concat failed. Exit code: {e.returncode}")
+            print(f"FFmpeg stderr:\n{e.stderr}")
+            raise
+
+    return str(output_path)
+
+
+def assemble_broll_parallel(original_video_path: str, broll_insertions: list, output_path: str,
+                            output_w: int, output_h: int,
+                            rendition_for: Callable[[str, int, int, str, float], tuple | None] = None) -> str:
+    """
+    Inserts B-roll into the original video with every A-roll stretch and
+    B-roll clip encoded as an independent, concurrently encoded segment.
+    The original audio runs unchanged underneath.
+
+    `broll_insertions` entries are {"start", "end", "broll_path"}, sorted.
+
+    `rendition_for(broll_path, width, height, fps, seconds)` may return
+    (rendition_path, seconds) for a clip encoded at the output settings (see
+    encode_rendition); insertions it covers are stream-copied. It is called
+    from the segment jobs, so a rendition encoded on first use runs alongside
+    the other segments instead of before them.
+    """
+    fps = get_video_frame_rate(original_video_path) or "30"
+    # One lookup per clip at a time, so a clip used twice is encoded once.
+    locks = {insertion["broll_path"]: threading.Lock() for insertion in broll_insertions}
+
+    def _rendition(broll_path: str, seconds: float):
+        with locks[broll_path]:
+            return rendition_for(broll_path, output_w, output_h, fps, seconds)
+
+    timeline = []
+    last_end = 0.0
+    for insertion in broll_insertions:
+        start, end = insertion["start"], insertion["end"]
+        timeline.append({"source": original_video_path, "start": last_end, "end": start})
+        entry = {"source": insertion["broll_path"], "start": 0.0, "end": end - start, "hold_last_frame": True}
+        if rendition_for:
+            entry["rendition"] = partial(_rendition, insertion["broll_path"], end - start)
+        timeline.append(entry)
+        last_end = end
+    timeline.append({"source": original_video_path, "start": last_end,
+                     "end": get_media_duration(original_video_path)})
+
+    return render_timeline_parallel(timeline, original_video_path, output_path, output_w, output_h, fps)
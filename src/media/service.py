@@ -1,11 +1,50 @@
+import json
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 import subprocess
+import tempfile
+
+from dotenv import load_dotenv
+
+from src.preprocessing.loudness import EBUR128_FILTER, parse_ebur128_summary
+from src.progress import progress_active, report_progress
+
+
+def run_ffmpeg_with_progress(cmd: list[str], total_seconds: float | None) -> subprocess.CompletedProcess:
+    """
+    Runs an FFmpeg command like subprocess.run(cmd, check=True,
+    capture_output=True, text=True), additionally reporting the output
+    position against `total_seconds` to the job's progress (see
+    src/progress.py) from FFmpeg's machine-readable -progress stream.
+    """
+    if not total_seconds or not progress_active():
+        return subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with tempfile.TemporaryFile() as stderr_log:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_log, text=True)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_ms is in microseconds too, despite its name.
+            if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                report_progress(int(value) / 1_000_000, total_seconds)
+        returncode = process.wait()
+        stderr_log.seek(0)
+        stderr = stderr_log.read().decode(errors="replace")
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, returncode, stdout="", stderr=stderr)
 
 
 def extract_audio_from_video(
         video_path_str: str,
-        output_path_str: str = None
-) -> str:
+        output_path_str: str = None,
+        measure_loudness: bool = False,
+        sample_rate: int | None = 16000,
+        channels: int | None = 1
+):
     """
     Extracts audio from a video file using FFmpeg and saves it as a WAV file.
 
@@ -14,9 +53,14 @@ def extract_audio_from_video(
         output_path_str (str, optional): The full, exact path to save the output audio file.
                                          If None, it saves a .wav file with the same name
                                          in the same directory as the video.
+        measure_loudness (bool, optional): Also measure the original audio's loudness
+                                           (EBU R128) in the same decode.
+        sample_rate, channels (int, optional): Output format. Defaults suit speech
+                                               recognition; None keeps the source's.
 
     Returns:
-        The path to the extracted audio file.
+        The path to the extracted audio file, or (path, loudness) when
+        measure_loudness is set.
     """
     video_path = Path(video_path_str)
 
@@ -33,24 +77,55 @@ def extract_audio_from_video(
     # Ensure the parent directory for the output file exists.
     output_audio_path.parent.mkdir(parents=True, exist_ok=True)
 
+    source_audio = probe_media(str(video_path)).audio
+    if source_audio is None:
+        raise ValueError(f"'{video_path.name}' has no audio track to extract.")
+    # Already 16-bit PCM in the requested format: copy the samples, don't re-encode.
+    stream_copy = (
+        not measure_loudness
+        and source_audio.get("codec_name") == "pcm_s16le"
+        and sample_rate in (None, source_audio.get("sample_rate"))
+        and channels in (None, source_audio.get("channels"))
+    )
+
     # 2. Construct the FFmpeg command using the final output path.
     cmd = [
         "ffmpeg",
         "-y",  # Overwrite output file if it exists
         "-i", str(video_path),  # Input video
+    ]
+    if measure_loudness:
+        # Split the decoded audio: one branch is measured at its original rate
+        # and channel layout, the other is written out as usual.
+        cmd += [
+            "-filter_complex", f"[0:a:0]asplit=2[extract][measure];[measure]{EBUR128_FILTER}[measured]",
+            "-map", "[extract]",
+        ]
+    cmd += [
         "-vn",  # No video output (discard video stream)
-        "-acodec", "pcm_s16le",  # Use WAV codec for uncompressed audio quality
-        "-ar", "16000",  # Standard sample rate for speech recognition
-        "-ac", "1",  # Convert to mono channel
-        str(output_audio_path)
     ]
+    if stream_copy:
+        cmd += ["-acodec", "copy"]
+    else:
+        cmd += ["-acodec", "pcm_s16le"]  # Use WAV codec for uncompressed audio quality
+        if sample_rate:
+            cmd += ["-ar", str(sample_rate)]  # 16 kHz is standard for speech recognition
+        if channels:
+            cmd += ["-ac", str(channels)]  # Mono for speech recognition
+    cmd += [str(output_audio_path)]
+    if measure_loudness:
+        cmd += ["-map", "[measured]", "-f", "null", "-"]
 
     print(f"Running FFmpeg to extract audio to: {output_audio_path}")
 
     try:
         # 3. Execute the command.
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        result = run_ffmpeg_with_progress(cmd, get_media_duration(str(video_path)) if progress_active() else None)
         print("✅ Audio extraction successful.")
+        if measure_loudness:
+            loudness = parse_ebur128_summary(result.stderr)
+            print(f"Measured loudness: {loudness['integrated_lufs']} LUFS integrated.")
+            return str(output_audio_path), loudness
         return str(output_audio_path)
     except subprocess.CalledProcessError as e:
         # If FFmpeg fails, print its detailed error output for easier debugging.
@@ -58,7 +133,231 @@ def extract_audio_from_video(
         print(f"FFmpeg stderr:\n{e.stderr}")
 
 
-def replace_audio_in_video(video_path_str: str, new_audio_path_str: str, output_dir_str: str) -> str:
+load_dotenv()
+
+_VIDEO_FIELDS = ("codec_name", "profile", "level", "refs", "has_b_frames",
+                 "width", "height", "pix_fmt", "r_frame_rate", "time_base")
+_AUDIO_FIELDS = ("codec_name", "sample_rate", "channels", "duration")
+
+# In-process cache: (abspath, size, mtime_ns) -> MediaInfo, least recently used first.
+MEDIA_INFO_CACHE_SIZE = 256
+_media_info_cache: OrderedDict = OrderedDict()
+_media_info_lock = threading.Lock()
+
+# Uploads longer than this are rejected before any processing.
+MAX_MEDIA_SECONDS = float(os.getenv("MAX_MEDIA_SECONDS", str(4 * 3600)))
+
+
+def _to_float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pick(stream: dict | None, fields: tuple) -> dict | None:
+    if stream is None:
+        return None
+    picked = {field: stream.get(field) for field in fields if stream.get(field) is not None}
+    for field in ("width", "height", "level", "refs", "has_b_frames", "sample_rate", "channels"):
+        if field in picked:
+            picked[field] = int(picked[field])
+    if "duration" in picked:
+        picked["duration"] = _to_float(picked["duration"])
+    return picked
+
+
+class MediaInfo:
+    """
+    Everything the pipeline needs to know about a media file, from a single
+    ffprobe run: container format and duration plus the first video and audio
+    stream. Keyframe times are probed lazily (they need a packet scan) and
+    cached alongside.
+
+    Instances are cached in-process by (path, size, mtime), and `to_dict()`
+    is stored on the job record so later runs on a fresh download of the same
+    upload skip ffprobe entirely (see probe_media).
+    """
+
+    def __init__(self, path: str, size: int, mtime_ns: int, format_name: str, duration: float,
+                 video: dict | None, audio: dict | None, keyframes: list[float] | None = None):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.format_name = format_name
+        self.duration = duration
+        self.video = video
+        self.audio = audio
+        self.keyframes = keyframes
+
+    @classmethod
+    def from_ffprobe(cls, path: str, stat: os.stat_result, probe: dict) -> "MediaInfo":
+        streams = probe.get("streams", [])
+        video = next((st for st in streams if st.get("codec_type") == "video"
+                      and not st.get("disposition", {}).get("attached_pic")), None)
+        audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+        fmt = probe.get("format", {})
+        return cls(
+            path=path,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            format_name=fmt.get("format_name", ""),
+            duration=_to_float(fmt.get("duration")),
+            video=_pick(video, _VIDEO_FIELDS),
+            audio=_pick(audio, _AUDIO_FIELDS),
+        )
+
+    @property
+    def has_video(self) -> bool:
+        return self.video is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio is not None
+
+    @property
+    def frame_rate(self) -> str | None:
+        return self.video.get("r_frame_rate") if self.video else None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": os.path.basename(self.path),
+            "size": self.size,
+            "format_name": self.format_name,
+            "duration": self.duration,
+            "video": self.video,
+            "audio": self.audio,
+            "keyframe_times": self.keyframes,
+        }
+
+    @classmethod
+    def from_dict(cls, path: str, stat: os.stat_result, data: dict) -> "MediaInfo":
+        return cls(path=path, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                   format_name=data.get("format_name", ""), duration=data.get("duration"),
+                   video=data.get("video"), audio=data.get("audio"), keyframes=data.get("keyframe_times"))
+
+
+def _run_ffprobe(media_path_str: str) -> dict:
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_format",
+        "-show_streams",
+        "-of", "json",
+        media_path_str
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+
+def probe_media(media_path_str: str, known: dict | None = None) -> MediaInfo:
+    """
+    Returns the file's MediaInfo, running ffprobe at most once per
+    (path, size, mtime).
+
+    `known` is a previous `MediaInfo.to_dict()` stored on the job record; it
+    is trusted when the file name and size match, since a job's upload never
+    changes under it even though each run downloads a fresh copy.
+    """
+    path = os.path.abspath(media_path_str)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    with _media_info_lock:
+        info = _media_info_cache.get(key)
+        if info is not None:
+            _media_info_cache.move_to_end(key)
+            return info
+
+    if known and known.get("name") == os.path.basename(path) and known.get("size") == stat.st_size:
+        info = MediaInfo.from_dict(path, stat, known)
+    else:
+        info = MediaInfo.from_ffprobe(path, stat, _run_ffprobe(path))
+
+    with _media_info_lock:
+        _media_info_cache[key] = info
+        _media_info_cache.move_to_end(key)
+        while len(_media_info_cache) > MEDIA_INFO_CACHE_SIZE:
+            _media_info_cache.popitem(last=False)
+    return info
+
+
+def check_supported_media(info: MediaInfo, expect_video: bool = False):
+    """
+    Rejects uploads the pipeline can't process, before any heavy work.
+    Raises ValueError with a user-facing reason.
+    """
+    if not info.has_audio:
+        raise ValueError("The uploaded file has no audio track.")
+    if expect_video and not info.has_video:
+        raise ValueError("The uploaded file has no video track.")
+    if not info.duration or info.duration <= 0:
+        raise ValueError("Could not determine the uploaded file's duration.")
+    if info.duration > MAX_MEDIA_SECONDS:
+        raise ValueError(f"The uploaded file is longer than the {MAX_MEDIA_SECONDS / 3600:.0f} hour limit.")
+
+
+def get_media_duration(media_path_str: str) -> float:
+    """Returns the container duration in seconds (cached ffprobe, no decode)."""
+    return probe_media(media_path_str).duration
+
+
+def get_video_frame_rate(media_path_str: str) -> str:
+    """Returns the first video stream's frame rate as FFmpeg reports it, e.g. '30000/1001'."""
+    return probe_media(media_path_str).frame_rate
+
+
+def probe_video_stream(media_path_str: str) -> dict:
+    """
+    Returns the first video stream's encoding parameters (codec_name, profile,
+    level, refs, has_b_frames, width, height, pix_fmt, r_frame_rate, time_base)
+    as reported by ffprobe.
+    """
+    return dict(probe_media(media_path_str).video or {})
+
+
+def probe_audio_stream(media_path_str: str) -> dict:
+    """
+    Returns the first audio stream's parameters (codec_name, sample_rate,
+    channels, duration) as reported by ffprobe. Numeric fields are converted.
+    """
+    return dict(probe_media(media_path_str).audio or {})
+
+
+def probe_keyframes(media_path_str: str) -> list[float]:
+    """
+    Returns the presentation times (seconds, ascending) of the video keyframes.
+    Reads packet flags only, so nothing is decoded; cached on the MediaInfo.
+
+    Times are relative to the file's start_time, the clock the ffmpeg CLI uses
+    for input -ss and -segment_times, rather than raw packet timestamps.
+    """
+    info = probe_media(media_path_str)
+    if info.keyframes is not None:
+        return info.keyframes
+
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags:format=start_time",
+        "-of", "json",
+        media_path_str
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    probe = json.loads(result.stdout)
+    start_time = _to_float(probe.get("format", {}).get("start_time")) or 0.0
+    keyframes = []
+    for packet in probe.get("packets", []):
+        pts_time = _to_float(packet.get("pts_time"))
+        if "K" in packet.get("flags", "") and pts_time is not None:
+            keyframes.append(max(0.0, pts_time - start_time))
+    info.keyframes = sorted(keyframes)
+    return info.keyframes
+
+
+def replace_audio_in_video(video_path_str: str, new_audio_path_str: str, output_dir_str: str,
+                           gain_db: float = 0.0) -> str:
 
     video_path = Path(video_path_str)
     new_audio_path = Path(new_audio_path_str)
@@ -77,11 +376,21 @@ def replace_audio_in_video(video_path_str: str, new_audio_path_str: str, output_
         "-c:v", "copy",  # CRITICAL: Stream copy video, no re-encoding, very fast!
         "-map", "0:v:0",  # Map the video stream from the first input
         "-map", "1:a:0",  # Map the audio stream from the second input
+    ]
+    if gain_db:
+        # Loudness normalization rides along with the audio encode this mux does anyway.
+        cmd += ["-af", f"volume={gain_db:.2f}dB"]
+    cmd += [
         "-shortest",  # Finish when the shorter of the two streams ends
         str(output_video_path)
     ]
 
     print(f"Executing FFmpeg to replace audio, saving to: {output_video_path}")
-    subprocess.run(cmd, check=True)
+    try:
+        run_ffmpeg_with_progress(cmd, get_media_duration(str(video_path)) if progress_active() else None)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ FFmpeg audio replacement failed. Exit code: {e.returncode}")
+        print(f"FFmpeg stderr:\n{e.stderr}")
+        raise
 
     return str(output_video_path)
@@ -0,0 +1,338 @@
+import subprocess
+from bisect import bisect_left, bisect_right
+from fractions import Fraction
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from src.media.service import get_media_duration, probe_keyframes, probe_video_stream
+
+# Copying a GOP run shorter than this isn't worth the extra concat piece.
+MIN_COPY_SECONDS = 1.0
+# Below this, a boundary piece is treated as empty.
+EPSILON = 0.001
+
+# ffprobe profile names -> libx264 -profile:v values.
+_X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def can_smart_render(stream: dict, width: int = None, height: int = None) -> bool:
+    """
+    Smart rendering stream-copies the source's own H.264 GOPs, so it needs an
+    H.264 source whose frame size already matches the requested output, and
+    whose profile, level, reference and B-frame settings are known so the
+    re-encoded pieces can be made to match them (see _encoder_args).
+    Anything else goes through the regular FFmpeg engine.
+    """
+    if stream.get("codec_name") != "h264":
+        return False
+    if width and height and (stream.get("width"), stream.get("height")) != (int(width), int(height)):
+        return False
+    if stream.get("profile") not in _X264_PROFILES:
+        return False
+    if any(stream.get(field) is None for field in ("level", "refs", "has_b_frames")) or stream["level"] <= 0:
+        return False
+    try:
+        return _frame_rate(stream) > 0
+    except (ValueError, ZeroDivisionError):
+        return False
+
+
+def _encoder_args(stream: dict) -> list[str]:
+    """
+    libx264 settings mirroring the source stream so re-encoded pieces concat
+    cleanly with the copied GOPs: same profile, level, reference count and
+    B-frame reordering, so the decoder never has to change DPB size or
+    reorder depth mid-stream. Each keyframe repeats its SPS/PPS, so a decoder
+    picks up the pieces' parameter sets rather than reusing the source's.
+    """
+    refs = max(1, stream.get("refs", 1))
+    reorder = stream.get("has_b_frames", 0)
+    # ffprobe's has_b_frames is the reorder depth: 1 is plain B-frames,
+    # 2 or more is what x264's default B-pyramid produces.
+    if reorder == 0:
+        bframes = "bframes=0"
+    elif reorder == 1:
+        bframes = "bframes=3:b-pyramid=none"
+    else:
+        bframes = "bframes=3:b-pyramid=normal"
+    args = [
+        "-c:v", "libx264",
+        "-preset", "ultrafast",
+        "-crf", "20",
+        "-pix_fmt", stream.get("pix_fmt", "yuv420p"),
+        "-r", stream.get("r_frame_rate", "30"),
+    ]
+    x264_params = f"ref={refs}:{bframes}:repeat-headers=1"
+    profile = _X264_PROFILES.get(stream.get("profile"))
+    if profile:
+        args += ["-profile:v", profile]
+        if profile.startswith("high"):
+            # ultrafast turns 8x8 transforms off, which x264 signals as Main.
+            x264_params += ":8x8dct=1"
+    args += ["-x264-params", x264_params]
+    if stream.get("level", 0) > 0:
+        # ffprobe reports H.264 level_idc, e.g. 41 for level 4.1 (9 is level 1b).
+        args += ["-level", "1b" if stream["level"] == 9 else f"{stream['level'] / 10:.1f}"]
+    return args
+
+
+def _frame_rate(stream: dict) -> Fraction:
+    return Fraction(stream.get("r_frame_rate") or "30")
+
+
+def snap_to_frame(t: float, rate: Fraction) -> float:
+    """Moves `t` to the nearest frame boundary (n / rate) of the source's frame grid."""
+    return float(round(Fraction(t) * rate) / rate)
+
+
+def _run_ffmpeg(cmd: list[str], description: str):
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ FFmpeg {description} failed. Exit code: {e.returncode}")
+        print(f"FFmpeg stderr:\n{e.stderr}")
+        raise
+
+
+def _split_into_gops(source: str, boundaries: list[float], work_dir: Path) -> list[Path]:
+    """
+    Stream-copies the source's video into MPEG-TS segments split exactly at
+    `boundaries` (keyframe times), in a single pass with no decoding.
+    Segment 0 covers [0, boundaries[0]), segment i covers
+    [boundaries[i - 1], boundaries[i]).
+    """
+    # The segment muxer cuts at the first keyframe at/after each time, so aim
+    # just below the keyframe in case ffprobe rounded its time upwards.
+    segment_times = ",".join(f"{max(0.0, t - EPSILON / 2):.6f}" for t in boundaries)
+    pattern = work_dir / "gop_%05d.ts"
+    _run_ffmpeg([
+        "ffmpeg", "-y",
+        "-i", source,
+        "-map", "0:v:0", "-an",
+        "-c:v", "copy",
+        "-bsf:v", "h264_mp4toannexb",
+        "-f", "segment",
+        "-segment_format", "mpegts",
+        "-segment_times", segment_times,
+        "-reset_timestamps", "1",
+        str(pattern)
+    ], "GOP split")
+    return [work_dir / f"gop_{i:05d}.ts" for i in range(len(boundaries) + 1)]
+
+
+def _encode_piece(source: str, start: float, frames: int, out_path: Path, stream: dict, video_filter: str = None):
+    # An exact frame count rather than -t: a duration lands on whichever frame
+    # the rounding picks, and those odd frames add up over many pieces.
+    cmd = [
+        "ffmpeg", "-y",
+        "-ss", f"{start:.6f}", "-i", source,
+        "-frames:v", str(frames),
+        "-map", "0:v:0", "-an",
+    ]
+    if video_filter:
+        cmd += ["-vf", video_filter]
+    cmd += _encoder_args(stream) + ["-bsf:v", "h264_mp4toannexb", "-f", "mpegts", str(out_path)]
+    _run_ffmpeg(cmd, "boundary re-encode")
+
+
+def split_at_keyframes(start: float, end: float, keyframes: list[float]) -> list[tuple]:
+    """
+    Splits [start, end) into (start, end, mode) pieces: a stream-copied run
+    from the first keyframe at/after `start` to the last keyframe at/before
+    `end`, plus re-encoded heads and tails around it.
+    """
+    first = bisect_left(keyframes, start - EPSILON)
+    last = bisect_right(keyframes, end + EPSILON) - 1
+    if first >= len(keyframes) or last <= first or keyframes[last] - keyframes[first] < MIN_COPY_SECONDS:
+        return [(start, end, "encode")]
+
+    copy_start, copy_end = keyframes[first], keyframes[last]
+    pieces = []
+    if copy_start - start > EPSILON:
+        pieces.append((start, copy_start, "encode"))
+    pieces.append((copy_start, copy_end, "copy"))
+    if end - copy_end > EPSILON:
+        pieces.append((copy_end, end, "encode"))
+    return pieces
+
+
+def render_video_timeline(timeline: list[dict], reference_path: str, work_dir: str) -> tuple[Path, dict]:
+    """
+    Renders a video-only timeline into MPEG-TS pieces and writes a concat
+    demuxer list for them.
+
+    Each timeline entry is {"source", "start", "end"} plus an optional
+    "video_filter". Entries whose source is `reference_path` are smart
+    rendered (GOPs copied, only boundaries re-encoded); any other source is
+    fully re-encoded with the reference's encoder parameters.
+
+    Copied runs are cut out of a single GOP-split pass over the reference,
+    so they start and end exactly on keyframes. Entry bounds are snapped to
+    the reference's frame grid and re-encoded pieces are cut by frame count,
+    so the output is exactly as long as the snapped timeline; callers cut
+    their audio with the same snapped bounds (see snap_to_frame).
+
+    Returns (concat_list_path, stats).
+    """
+    stream = probe_video_stream(reference_path)
+    keyframes = probe_keyframes(reference_path)
+    rate = _frame_rate(stream)
+    work_dir = Path(work_dir)
+    stats = {"copied_seconds": 0.0, "encoded_seconds": 0.0, "pieces": 0}
+
+    planned = []
+    for entry in timeline:
+        start, end = snap_to_frame(entry["start"], rate), snap_to_frame(entry["end"], rate)
+        if end - start <= EPSILON:
+            continue
+        if entry["source"] == reference_path and not entry.get("video_filter"):
+            pieces = split_at_keyframes(start, end, keyframes)
+        else:
+            pieces = [(start, end, "encode")]
+        planned.extend((entry, piece) for piece in pieces)
+
+    # All copied runs come out of one GOP-splitting pass over the reference.
+    # Keyframe 0 starts the first segment anyway, so it is not a split point.
+    boundaries = sorted({t for _, (s, e, mode) in planned if mode == "copy" for t in (s, e) if t > EPSILON})
+    gops = _split_into_gops(reference_path, boundaries, work_dir) if boundaries else []
+
+    def _gop_index(t: float) -> int:
+        return 0 if t <= EPSILON else boundaries.index(t) + 1
+
+    piece_paths = []
+    for entry, (piece_start, piece_end, mode) in planned:
+        if mode == "copy":
+            piece_paths.extend(gops[_gop_index(piece_start):_gop_index(piece_end)])
+            stats["copied_seconds"] += piece_end - piece_start
+        else:
+            out_path = work_dir / f"piece_{len(piece_paths):05d}.ts"
+            frames = round(piece_end * rate) - round(piece_start * rate)
+            if frames <= 0:
+                continue
+            _encode_piece(entry["source"], piece_start, frames, out_path, stream, entry.get("video_filter"))
+            stats["encoded_seconds"] += piece_end - piece_start
+            piece_paths.append(out_path)
+
+    stats["pieces"] = len(piece_paths)
+    concat_list_path = work_dir / "concat_list.txt"
+    with open(concat_list_path, "w") as f:
+        for piece in piece_paths:
+            f.write(f"file '{piece.as_posix()}'\n")
+    return concat_list_path, stats
+
+
+def _report(stats: dict):
+    total = stats["copied_seconds"] + stats["encoded_seconds"]
+    share = stats["copied_seconds"] / total * 100 if total else 0
+    print(f"Smart render: {stats['pieces']} pieces, {stats['copied_seconds']:.1f}s copied, "
+          f"{stats['encoded_seconds']:.1f}s re-encoded ({share:.0f}% stream-copied).")
+
+
+def smart_cut_video(video_path: str, keep_intervals: list[tuple], output_path: str,
+                    audio_fade: float = 0.005, audio_path: str = None, gain_db: float = 0.0) -> str:
+    """
+    Keeps only `keep_intervals` of the video, copying untouched GOPs and
+    re-encoding just the GOPs around each cut. Audio (the video's own, or
+    `audio_path` if given) is cut in the same final mux with short fades at
+    each join, and `gain_db` is applied there too.
+
+    The intervals are snapped to the video's frame grid first and the audio is
+    cut at the same snapped times, so every kept interval has exactly as much
+    audio as video and the two can't drift apart over many cuts.
+    """
+    rate = _frame_rate(probe_video_stream(video_path))
+    snapped = ((snap_to_frame(start, rate), snap_to_frame(end, rate)) for start, end in keep_intervals)
+    keep_intervals = [(start, end) for start, end in snapped if end - start > EPSILON]
+    timeline = [{"source": video_path, "start": start, "end": end} for start, end in keep_intervals]
+
+    with TemporaryDirectory() as work_dir:
+        concat_list_path, stats = render_video_timeline(timeline, video_path, work_dir)
+        _report(stats)
+
+        audio_parts = []
+        for i, (start, end) in enumerate(keep_intervals):
+            length = end - start
+            fade = min(audio_fade, length / 2)
+            audio_parts.append(
+                f"[1:a]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS,"
+                f"afade=t=in:d={fade:.4f},afade=t=out:st={length - fade:.6f}:d={fade:.4f}[a{i}]"
+            )
+        audio_labels = "".join(f"[a{i}]" for i in range(len(keep_intervals)))
+        gain = f",volume={gain_db:.2f}dB" if gain_db else ""
+        audio_parts.append(f"{audio_labels}concat=n={len(keep_intervals)}:v=0:a=1{gain}[aout]")
+
+        script_path = Path(work_dir) / "audio_graph.txt"
+        script_path.write_text(";\n".join(audio_parts))
+
+        _run_ffmpeg([
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(concat_list_path),
+            "-i", audio_path or video_path,
+            "-filter_complex_script", str(script_path),
+            "-map", "0:v", "-map", "[aout]",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            str(output_path)
+        ], "smart render mux")
+
+    return str(output_path)
+
+
+def smart_assemble_broll(original_video_path: str, broll_insertions: list, output_path: str,
+                         output_w: int, output_h: int) -> str:
+    """
+    Inserts B-roll into the original video, copying every A-roll GOP that no
+    insertion touches and re-encoding only B-roll clips and cut boundaries.
+    The original audio track is copied unchanged.
+
+    `broll_insertions` entries are {"start", "end", "broll_path"}, sorted.
+    """
+    stream = probe_video_stream(original_video_path)
+    fps = stream.get("r_frame_rate", "30")
+    rate = _frame_rate(stream)
+    broll_filter = (
+        f"scale={output_w}:{output_h}:force_original_aspect_ratio=decrease,"
+        f"pad=width={output_w}:height={output_h}:x=-1:y=-1:color=black,"
+        f"setsar=1,fps={fps}"
+    )
+
+    timeline = []
+    last_end = 0.0
+    for insertion in broll_insertions:
+        # On the frame grid, the clip's slot is a whole number of frames and the
+        # A-roll around it resumes exactly where the copied audio expects it.
+        start, end = snap_to_frame(insertion["start"], rate), snap_to_frame(insertion["end"], rate)
+        timeline.append({"source": original_video_path, "start": last_end, "end": start})
+        # A clip shorter than its slot freezes on its last frame instead of ending
+        # early and pulling the rest of the video out of sync with the audio.
+        timeline.append({"source": insertion["broll_path"], "start": 0.0, "end": end - start,
+                         "video_filter": f"{broll_filter},tpad=stop_mode=clone:stop_duration={end - start:.3f}"})
+        last_end = end
+    timeline.append({"source": original_video_path, "start": last_end,
+                     "end": get_media_duration(original_video_path)})
+
+    with TemporaryDirectory() as work_dir:
+        concat_list_path, stats = render_video_timeline(timeline, original_video_path, work_dir)
+        _report(stats)
+
+        _run_ffmpeg([
+            "ffmpeg", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(concat_list_path),
+            "-i", original_video_path,
+            "-map", "0:v", "-map", "1:a?",
+            "-c", "copy",
+            "-shortest",
+            "-movflags", "+faststart",
+            str(output_path)
+        ], "smart render mux")
+
+    return str(output_path)
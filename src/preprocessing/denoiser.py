@@ -3,8 +3,25 @@ import os
 import httpx
 import asyncio
 
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+from scipy.signal import lfilter
+
+from src.preprocessing.pipeline import AudioPipeline, DenoiseStage
+
 load_dotenv()
 
+# Denoising backends selectable through the job's `denoiseEngine` option.
+DENOISE_ENGINES = ("cleanvoice", "local")
+DEFAULT_DENOISE_ENGINE = os.getenv("DENOISE_ENGINE", "cleanvoice")
+
+# Local spectral gate: how far (dB) noise is pulled down, and how far above the
+# estimated noise floor (dB) a time-frequency bin must be to count as signal.
+LOCAL_DENOISE_REDUCTION_DB = float(os.getenv("LOCAL_DENOISE_REDUCTION_DB", "12"))
+LOCAL_DENOISE_THRESHOLD_DB = float(os.getenv("LOCAL_DENOISE_THRESHOLD_DB", "6"))
+# STFT frames between noise floor re-estimates.
+NOISE_UPDATE_FRAMES = 32
+
 CLEANVOICE_BASE_URL = "https://api.cleanvoice.ai"
 CLEANVOICE_API_KEY = os.getenv("CLEANVOICE_API_KEY")
 CLEANVOICE_HEADERS = {
@@ -12,6 +29,168 @@ CLEANVOICE_HEADERS = {
     "X-API-Key": CLEANVOICE_API_KEY
 }
 
+def resolve_denoise_engine(options: dict) -> str:
+    engine = options.get("denoiseEngine") or DEFAULT_DENOISE_ENGINE
+    if engine not in DENOISE_ENGINES:
+        raise ValueError(f"Unknown denoise engine '{engine}'. Expected one of {DENOISE_ENGINES}.")
+    return engine
+
+
+class SpectralGateDenoiser:
+    """
+    Streaming spectral-gating noise reduction.
+
+    Audio is pushed through `process(block)` in arbitrary-sized blocks of shape
+    (frames, channels) and the denoised audio comes back in order; `flush()`
+    returns the tail held back by the STFT overlap. The noise floor is tracked
+    per frequency bin as a low percentile of the last few seconds of spectra,
+    so it adapts to changing background noise without a separate profiling
+    pass. Bins that don't rise `threshold_db` above the floor are attenuated by
+    `reduction_db`; the mask is smoothed across frequency and time to avoid
+    musical-noise artefacts. All channels share one mask.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int = 1,
+        reduction_db: float = LOCAL_DENOISE_REDUCTION_DB,
+        threshold_db: float = LOCAL_DENOISE_THRESHOLD_DB,
+        noise_window_seconds: float = 5.0,
+        noise_percentile: float = 10.0,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        # ~40 ms analysis frames at 75% overlap.
+        self.n_fft = 1 << int(round(np.log2(sample_rate * 0.04)))
+        self.hop = self.n_fft // 4
+        self.window = np.hanning(self.n_fft + 1)[:-1].astype(np.float32)
+        # Hann analysis + synthesis at 75% overlap sums to 1.5.
+        self.synthesis = self.window / 1.5
+
+        self.threshold_db = threshold_db
+        self.noise_percentile = noise_percentile
+        self.floor_gain = 10 ** (-reduction_db / 20)
+        self.freq_smoothing = max(1, int(round(150 / (sample_rate / self.n_fft))))  # ~150 Hz
+        self.power_alpha = self._one_pole(0.03)  # ~30 ms level averaging
+        self.time_alpha = self._one_pole(0.05)  # ~50 ms gain release
+
+        bins = self.n_fft // 2 + 1
+        self._history = np.full((max(1, int(noise_window_seconds * sample_rate / self.hop)), bins),
+                                np.nan, dtype=np.float32)
+        self._history_pos = 0
+        self._frames_seen = 0
+        self._min_history = int(sample_rate / self.hop)
+        self._noise_floor = None
+        self._power_state = np.zeros((1, bins))
+        self._smoothing_state = np.zeros((1, bins))
+
+        # Pre-pad so the first output sample lines up with the first input sample.
+        self._pending = np.zeros((self.n_fft - self.hop, channels), dtype=np.float32)
+        self._overlap = np.zeros((self.n_fft, channels), dtype=np.float32)
+        self._to_discard = self.n_fft - self.hop
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def _one_pole(self, seconds: float) -> float:
+        """Coefficient of a one-pole smoother with the given time constant, per STFT frame."""
+        return float(np.exp(-1.0 / max(seconds * self.sample_rate / self.hop, 1.0)))
+
+    def _noise_floors(self, magnitude_db: np.ndarray) -> np.ndarray:
+        """
+        Per-frame noise floor estimates from the frames before them. The floor
+        is re-estimated every NOISE_UPDATE_FRAMES frames of the stream (not per
+        block), so the output doesn't depend on how the caller sizes blocks.
+        Until a second of audio has been seen, frames pass through ungated.
+        """
+        floors = np.empty_like(magnitude_db)
+        start = 0
+        while start < len(magnitude_db):
+            if self._frames_seen >= self._min_history and self._frames_seen % NOISE_UPDATE_FRAMES == 0:
+                history = self._history[~np.isnan(self._history[:, 0])]
+                self._noise_floor = np.percentile(history, self.noise_percentile, axis=0)
+            end = min(len(magnitude_db), start + NOISE_UPDATE_FRAMES - self._frames_seen % NOISE_UPDATE_FRAMES)
+            floors[start:end] = -np.inf if self._noise_floor is None else self._noise_floor
+            for row in magnitude_db[start:end]:
+                self._history[self._history_pos] = row
+                self._history_pos = (self._history_pos + 1) % len(self._history)
+            self._frames_seen += end - start
+            start = end
+        return floors
+
+    def _gains(self, power: np.ndarray) -> np.ndarray:
+        # Average power over neighbouring bins and frames first: single bins of
+        # pure noise fluctuate too much to gate reliably.
+        power = uniform_filter1d(power, self.freq_smoothing, axis=1, mode="nearest")
+        power, self._power_state = lfilter(
+            [1 - self.power_alpha], [1, -self.power_alpha], power, axis=0, zi=self._power_state
+        )
+        magnitude_db = 10 * np.log10(power + 1e-20)
+        noise_floor_db = self._noise_floors(magnitude_db)
+        mask = (magnitude_db > noise_floor_db + self.threshold_db).astype(np.float64)
+        mask = uniform_filter1d(mask, self.freq_smoothing, axis=1, mode="nearest")
+        # One-pole smoothing over time; the filter state carries across blocks.
+        mask, self._smoothing_state = lfilter(
+            [1 - self.time_alpha], [1, -self.time_alpha], mask, axis=0, zi=self._smoothing_state
+        )
+        return (self.floor_gain + (1 - self.floor_gain) * np.clip(mask, 0, 1)).astype(np.float32)
+
+    def _run_frames(self) -> np.ndarray:
+        n_frames = (len(self._pending) - self.n_fft) // self.hop + 1
+        if n_frames <= 0:
+            return np.zeros((0, self.channels), dtype=np.float32)
+
+        starts = np.arange(n_frames) * self.hop
+        frames = self._pending[starts[:, None] + np.arange(self.n_fft)]  # (frames, n_fft, channels)
+        spectra = np.fft.rfft(frames * self.window[None, :, None], axis=1)
+
+        power = (np.abs(spectra) ** 2).mean(axis=2)
+        spectra *= self._gains(power)[:, :, None]
+        processed = np.fft.irfft(spectra, n=self.n_fft, axis=1).astype(np.float32)
+        processed *= self.synthesis[None, :, None]
+
+        output = np.empty((n_frames * self.hop, self.channels), dtype=np.float32)
+        for i in range(n_frames):
+            self._overlap += processed[i]
+            output[i * self.hop:(i + 1) * self.hop] = self._overlap[:self.hop]
+            self._overlap = np.roll(self._overlap, -self.hop, axis=0)
+            self._overlap[-self.hop:] = 0
+
+        self._pending = self._pending[n_frames * self.hop:]
+        return output
+
+    def _emit(self, output: np.ndarray) -> np.ndarray:
+        if self._to_discard:
+            dropped = min(self._to_discard, len(output))
+            output = output[dropped:]
+            self._to_discard -= dropped
+        output = output[:max(0, self._samples_in - self._samples_out)]
+        self._samples_out += len(output)
+        return output
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32).reshape(len(block), self.channels)
+        self._samples_in += len(block)
+        self._pending = np.concatenate([self._pending, block])
+        return self._emit(self._run_frames())
+
+    def flush(self) -> np.ndarray:
+        self._pending = np.concatenate([self._pending, np.zeros((self.n_fft, self.channels), dtype=np.float32)])
+        return self._emit(self._run_frames())
+
+
+def denoise_audio_locally(input_path: str, output_path: str) -> str:
+    """
+    Denoises any FFmpeg-readable audio (or a video's audio track) in-process,
+    streaming it through SpectralGateDenoiser, and writes the result as WAV at
+    the input's sample rate.
+    """
+    print(f"Denoising '{os.path.basename(input_path)}' locally...")
+    AudioPipeline([DenoiseStage()]).run(input_path, output_path)
+    print("✅ Local denoising complete.")
+    return str(output_path)
+
+
 async def process_audio_from_url(public_audio_url: str, options: dict) -> str:
     """
     Submits a job to Cleanvoice using a public URL, polls for completion,
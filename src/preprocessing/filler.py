@@ -1,44 +1,53 @@
-from pydub import AudioSegment
+import os
+import subprocess
+import tempfile
+from bisect import bisect_left, bisect_right
+
 from moviepy import VideoFileClip, concatenate_videoclips, CompositeVideoClip
 from moviepy.video.fx  import CrossFadeIn
 from moviepy.audio.fx import AudioFadeIn
 from pathlib import Path
-from faster_whisper import WhisperModel
+
+from src.media.service import get_media_duration, get_video_frame_rate, probe_video_stream, run_ffmpeg_with_progress
+from src.media.smart_render import can_smart_render, smart_cut_video
+from src.preprocessing.pipeline import AudioPipeline, CutStage, GainStage
+from src.transcription.service import transcribe
+
+FILLER_WORDS = {"um", "uh", "like", "yeah", "er", "ah", "basically", "mm", "aa"}
+
+# Filler detection modes selectable through the job's `fillerDetection` option.
+FILLER_DETECTION_MODES = ("full", "refine")
+
+
+def resolve_filler_detection(options: dict) -> str:
+    mode = options.get("fillerDetection") or "full"
+    if mode not in FILLER_DETECTION_MODES:
+        raise ValueError(f"Unknown filler detection mode '{mode}'. Expected one of {FILLER_DETECTION_MODES}.")
+    return mode
+
+# Fade applied on each side of an audio cut.
+AUDIO_FADE_SECONDS = 0.01
+
 
 def transcribe_audio(
     file_path: Path,
     model_size: str,
     compute_type: str = "float32",
+    clip_timestamps: list[float] | None = None,
 ) -> dict:
+    """
+    Word-level transcription. `clip_timestamps` ([start, end, start, end, ...]
+    in seconds) restricts decoding to those windows; timestamps stay absolute.
+    """
     try:
-        model = WhisperModel(model_size, compute_type=compute_type)
-
-        segments, info = model.transcribe(file_path,
-                                          initial_prompt="Transcribe everything exactly as spoken,"
-                                                         "including ums and uhs, and absolutely all filler words",
-                                          vad_filter=False,
-                                          suppress_tokens=[],
-                                          beam_size=5,
-                                          word_timestamps=True,
-                                          condition_on_previous_text=False)
-
-        words = []
-        words_print = []
-        for segment in segments:
-            if segment.words:
-                for word in segment.words:
-                    words.append({
-                        "word": word.word.strip(),
-                        "start": round(word.start, 4),
-                        "end": round(word.end, 4),
-                    })
-                    words_print.append(word.word.strip())
-        full_text = " ".join(words_print)
+        transcript = transcribe(file_path, model_size, compute_type=compute_type,
+                                clip_timestamps=clip_timestamps)
+        words = transcript.words()
 
         return {
-            "full_text": [full_text],
-            "language": info.language,
-            "language_probability": round(info.language_probability, 3),
+            "full_text": [" ".join(word["word"] for word in words)],
+            "language": transcript.language,
+            "language_probability": round(transcript.language_probability, 3),
             "words": words
         }
 
@@ -49,12 +58,21 @@ def transcribe_audio(
             "words": []
         }
 
-def get_filler_timestamps_from_audio(audio_path: str) -> list[dict]:
+def get_filler_timestamps_from_audio(audio_path: str, mode: str = "full") -> list[dict]:
     """
     Transcribes the audio using base and medium models, aligns timestamps,
     and returns filler word timestamps.
+
+    mode="full" decodes the whole file with both models. mode="refine" decodes
+    the whole file once with base and re-decodes only the short windows around
+    base's filler candidates with medium.
     """
     audio_path = Path(audio_path)
+    if mode == "refine":
+        return get_filler_timestamps_refined(audio_path)
+    if mode != "full":
+        raise ValueError(f"Unknown filler detection mode '{mode}'. Expected one of {FILLER_DETECTION_MODES}.")
+
     # Step 1: Transcribe with base and medium models
     base = transcribe_audio(audio_path, model_size="base")
     medium = transcribe_audio(audio_path, model_size="medium")
@@ -68,9 +86,43 @@ def get_filler_timestamps_from_audio(audio_path: str) -> list[dict]:
     return filler_times
 
 
-def get_filler_word_timestamps(words: list) -> list:
-    FILLER_WORDS = {"um", "uh", "like", "yeah", "er", "ah", "basically", "mm", "aa"}
+def get_filler_timestamps_refined(audio_path: Path, padding: float = 1.0) -> list[dict]:
+    """
+    Cheap pass with the base model to find filler candidates, then a medium
+    pass restricted to the candidate windows to refine their timestamps.
+    """
+    base = transcribe_audio(audio_path, model_size="base")
+    candidates = get_filler_word_timestamps(base["words"])
+    if not candidates:
+        return []
+
+    windows = get_candidate_windows(candidates, padding=padding)
+    clip_timestamps = [t for window in windows for t in window]
+    print(f"Refining {len(candidates)} filler candidates in {len(windows)} windows "
+          f"({sum(end - start for start, end in windows):.1f}s of audio) with the medium model...")
+    medium = transcribe_audio(audio_path, model_size="medium", clip_timestamps=clip_timestamps)
 
+    aligned = align_transcripts(base["words"], medium["words"])
+    return get_filler_word_timestamps(aligned)
+
+
+def get_candidate_windows(candidates: list, padding: float = 1.0) -> list[tuple]:
+    """
+    Pads each candidate by `padding` seconds of context and merges overlapping
+    windows. Returns sorted (start, end) tuples.
+    """
+    windows = []
+    for candidate in sorted(candidates, key=lambda c: c["start"]):
+        start = max(0.0, candidate["start"] - padding)
+        end = candidate["end"] + padding
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return [(round(start, 3), round(end, 3)) for start, end in windows]
+
+
+def get_filler_word_timestamps(words: list) -> list:
     return [
         {"start": word["start"], "end": word["end"]}
         for word in words
@@ -84,28 +136,50 @@ def align_transcripts(base_words, medium_words, time_tolerance=0.5):
     For matching words (case-insensitive), replaces base timestamps with medium’s if within time tolerance.
     Keeps fillers from base even if unmatched.
 
+    Medium words are indexed by text and sorted by start time, so each base word
+    only inspects the same-text medium words inside its tolerance band instead
+    of scanning the whole medium transcript. Ties on time difference still go
+    to the earliest medium word, as in the original quadratic scan.
+
     Returns:
         List of {'word', 'start', 'end'} with best available timestamps.
     """
+    # word -> (sorted starts, medium indices in the same order)
+    index = {}
+    for idx, mw in enumerate(medium_words):
+        index.setdefault(mw["word"].lower(), []).append((mw["start"], idx))
+    bands = {}
+    for word, entries in index.items():
+        entries.sort()
+        bands[word] = ([start for start, _ in entries], [idx for _, idx in entries])
+
+    # Widen the bisect band slightly so float rounding at the edges never
+    # excludes a word that the exact `time_diff <= time_tolerance` check accepts.
+    epsilon = 1e-9
     aligned = []
     used_indices = set()
 
     for bw in base_words:
         word = bw["word"].lower()
         best_match = None
-        best_diff = float("inf")
-
-        for idx, mw in enumerate(medium_words):
-            if idx in used_indices:
-                continue
-            if mw["word"].lower() != word:
-                continue
-
-            # Match found — check time proximity
-            time_diff = abs(bw["start"] - mw["start"])
-            if time_diff < best_diff and time_diff <= time_tolerance:
-                best_diff = time_diff
-                best_match = (idx, mw)
+        best_key = None
+
+        band = bands.get(word)
+        if band:
+            starts, indices = band
+            lo = bisect_left(starts, bw["start"] - time_tolerance - epsilon)
+            hi = bisect_right(starts, bw["start"] + time_tolerance + epsilon)
+            for pos in range(lo, hi):
+                idx = indices[pos]
+                if idx in used_indices:
+                    continue
+                time_diff = abs(bw["start"] - starts[pos])
+                if time_diff > time_tolerance:
+                    continue
+                key = (time_diff, idx)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best_match = (idx, medium_words[idx])
 
         if best_match:
             idx, mw = best_match
@@ -122,27 +196,25 @@ def align_transcripts(base_words, medium_words, time_tolerance=0.5):
     return aligned
 
 
-
-def remove_filler_words_from_audio(audio_path: str, filler_timestamps: list = None,  output_path: str = None) -> str:
+def remove_filler_words_from_audio(audio_path: str, filler_timestamps: list = None,  output_path: str = None,
+                                   gain_db: float = 0.0) -> str:
     """
     Removes filler word segments from audio based on their start and end times.
+    The audio is streamed block by block, so memory doesn't grow with its length.
+    A non-zero `gain_db` (loudness normalization) is applied in the same pass.
     """
     if filler_timestamps is None:
         filler_timestamps = get_filler_timestamps_from_audio(audio_path)
 
-    audio = AudioSegment.from_file(audio_path)
-    cleaned_audio = AudioSegment.empty()
-
-    prev_end = 0
-    for filler in filler_timestamps:
-        cleaned_audio += audio[prev_end * 1000:filler["start"] * 1000]
-        prev_end = filler["end"]
-
-    cleaned_audio += audio[prev_end * 1000:]
-
     output_path = output_path or Path(audio_path).with_name(Path(audio_path).stem + "_no_filler.wav")
-    cleaned_audio.export(output_path, format="wav")
-    return str(output_path)
+
+    # The last interval runs to the end of the stream, whatever its length.
+    keep = get_keep_intervals(filler_timestamps, float("inf"))
+    print(f"Cutting {len(filler_timestamps)} fillers from audio ({len(keep)} kept intervals)...")
+    stages = [CutStage(keep, fade_duration=AUDIO_FADE_SECONDS)]
+    if gain_db:
+        stages.append(GainStage(gain_db))
+    return AudioPipeline(stages).run(audio_path, output_path)
 
 
 def remove_filler_words_from_video(video_path: str, filler_timestamps: list, output_path: str = None) -> str:
@@ -214,10 +286,149 @@ def remove_filler_words_from_video(video_path: str, filler_timestamps: list, out
 
     return str(output_path)
 
+# Cut engines accepted by remove_filler_words_smooth (job option `cutEngine`).
+CUT_ENGINES = ("ffmpeg", "smart", "moviepy")
+
+
+def resolve_cut_engine(options: dict) -> str:
+    engine = options.get("cutEngine") or "ffmpeg"
+    if engine not in CUT_ENGINES:
+        raise ValueError(f"Unknown cut engine '{engine}'. Expected one of {CUT_ENGINES}.")
+    return engine
+
+
+def get_keep_intervals(filler_timestamps: list, duration: float, min_length: float = 0.01) -> list[tuple]:
+    """
+    Inverts filler timestamps into the (start, end) intervals of media to keep.
+    Overlapping fillers are merged and slivers shorter than `min_length` dropped.
+    """
+    keep = []
+    prev_end = 0.0
+    for filler in sorted(filler_timestamps, key=lambda x: x["start"]):
+        if filler["start"] - prev_end >= min_length:
+            keep.append((prev_end, filler["start"]))
+        prev_end = max(prev_end, filler["end"])
+    if duration - prev_end >= min_length:
+        keep.append((prev_end, duration))
+    return keep
+
+
+def build_cut_filtergraph(
+    keep_intervals: list[tuple],
+    frame_rate: str,
+    transition_duration: float = 0.15,
+    video_input: str = "[0:v]",
+    audio_input: str = "[0:a]",
+) -> tuple[str, str, str]:
+    """
+    Builds one filtergraph that trims every kept interval from the inputs and
+    joins them with xfade/acrossfade (plain concat where a piece is too short
+    to crossfade). Every piece is pinned to `frame_rate`, since xfade only
+    accepts constant-frame-rate inputs. Returns (filtergraph, video_label, audio_label).
+    """
+    parts = []
+    n = len(keep_intervals)
+    video_split = f"{video_input}split={n}" + "".join(f"[vs{i}]" for i in range(n)) if n > 1 else None
+    audio_split = f"{audio_input}asplit={n}" + "".join(f"[as{i}]" for i in range(n)) if n > 1 else None
+    if n > 1:
+        parts.extend([video_split, audio_split])
+
+    for i, (start, end) in enumerate(keep_intervals):
+        v_in = f"[vs{i}]" if n > 1 else video_input
+        a_in = f"[as{i}]" if n > 1 else audio_input
+        parts.append(f"{v_in}trim=start={start:.3f}:end={end:.3f},setpts=PTS-STARTPTS,"
+                     f"fps={frame_rate}[v{i}]")
+        parts.append(f"{a_in}atrim=start={start:.3f}:end={end:.3f},asetpts=PTS-STARTPTS[a{i}]")
+
+    current_v, current_a = "[v0]", "[a0]"
+    current_length = keep_intervals[0][1] - keep_intervals[0][0]
+    for i in range(1, n):
+        length = keep_intervals[i][1] - keep_intervals[i][0]
+        # A crossfade can't be longer than half of either piece it joins.
+        fade = min(transition_duration, current_length / 2, length / 2)
+        out_v, out_a = f"[vx{i}]", f"[ax{i}]"
+        if fade >= 0.04:
+            parts.append(f"{current_v}[v{i}]xfade=transition=fade:duration={fade:.3f}:"
+                         f"offset={current_length - fade:.3f}{out_v}")
+            parts.append(f"{current_a}[a{i}]acrossfade=d={fade:.3f}{out_a}")
+            current_length += length - fade
+        else:
+            parts.append(f"{current_v}[v{i}]concat=n=2:v=1:a=0,fps={frame_rate}{out_v}")
+            parts.append(f"{current_a}[a{i}]concat=n=2:v=0:a=1{out_a}")
+            current_length += length
+        current_v, current_a = out_v, out_a
+
+    return ";\n".join(parts), current_v, current_a
+
+
+def remove_filler_words_ffmpeg(video_path: str,
+                               filler_timestamps: list,
+                               output_path: str = None,
+                               transition_duration: float = 0.15,
+                               audio_path: str = None,
+                               gain_db: float = 0.0) -> str:
+    """
+    Filler word removal in a single FFmpeg pass: one trim/atrim +
+    xfade/acrossfade filtergraph, streamed by FFmpeg in constant memory.
+
+    `audio_path` cuts a separately processed audio track (e.g. denoised) in
+    place of the video's own, and `gain_db` applies loudness normalization,
+    both within the same pass.
+    """
+    duration = get_media_duration(video_path)
+    keep = get_keep_intervals(filler_timestamps, duration)
+    if not keep:
+        print("Warning: No segments were left after removing fillers. Returning original path.")
+        return video_path
+
+    output_path = output_path or Path(video_path).with_name(
+        f"{Path(video_path).stem}_pro_filler.mp4"
+    )
+    filtergraph, video_label, audio_label = build_cut_filtergraph(
+        keep, get_video_frame_rate(video_path), transition_duration,
+        audio_input="[1:a]" if audio_path else "[0:a]"
+    )
+    if gain_db:
+        filtergraph += f";\n{audio_label}volume={gain_db:.2f}dB[normalized]"
+        audio_label = "[normalized]"
+
+    # Hundreds of fillers make a graph too long for the command line.
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as script:
+        script.write(filtergraph)
+    try:
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            *(["-i", audio_path] if audio_path else []),
+            "-filter_complex_script", script.name,
+            "-map", video_label,
+            "-map", audio_label,
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-crf", "24",
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
+        print(f"▶️ Cutting {len(filler_timestamps)} fillers ({len(keep)} kept segments) with FFmpeg...")
+        run_ffmpeg_with_progress(cmd, sum(end - start for start, end in keep))
+    except subprocess.CalledProcessError as e:
+        print(f"❌ FFmpeg filler cut failed. Exit code: {e.returncode}")
+        print(f"FFmpeg stderr:\n{e.stderr}")
+        raise
+    finally:
+        os.remove(script.name)
+
+    return str(output_path)
+
+
 def remove_filler_words_smooth(video_path: str,
                             filler_timestamps: list,
                             output_path: str = None,
-                            transition_duration: float = 0.15) -> str:
+                            transition_duration: float = 0.15,
+                            engine: str = "ffmpeg",
+                            audio_path: str = None,
+                            gain_db: float = 0.0) -> str:
     """
     Professional-grade filler word removal with proper CrossFadeIn transitions.
 
@@ -226,10 +437,35 @@ def remove_filler_words_smooth(video_path: str,
         filler_timestamps: List of {'start':, 'end':} dicts
         output_path: Optional output path
         transition_duration: Crossfade duration (0.1-1.0 seconds)
+        engine: "ffmpeg" (single filtergraph pass), "smart" (stream-copy untouched
+                GOPs, re-encode only around cuts; hard cuts, no crossfade) or
+                "moviepy" (frame-by-frame render)
+        audio_path: Processed audio to cut instead of the video's own track
+                    (ffmpeg and smart engines)
+        gain_db: Loudness normalization gain (ffmpeg and smart engines)
 
     Returns:
         Path to processed media
     """
+    if engine == "smart":
+        if can_smart_render(probe_video_stream(video_path)):
+            keep = get_keep_intervals(filler_timestamps, get_media_duration(video_path))
+            if not keep:
+                print("Warning: No segments were left after removing fillers. Returning original path.")
+                return video_path
+            output_path = output_path or Path(video_path).with_name(f"{Path(video_path).stem}_pro_filler.mp4")
+            return smart_cut_video(video_path, keep, str(output_path), audio_path=audio_path, gain_db=gain_db)
+        print("Source is not H.264; falling back to the FFmpeg filtergraph engine.")
+        engine = "ffmpeg"
+
+    if engine == "ffmpeg":
+        return remove_filler_words_ffmpeg(video_path, filler_timestamps, output_path, transition_duration,
+                                          audio_path=audio_path, gain_db=gain_db)
+    if engine != "moviepy":
+        raise ValueError(f"Unknown cut engine '{engine}'. Expected one of {CUT_ENGINES}.")
+    if audio_path or gain_db:
+        raise ValueError("The moviepy engine cuts the video's own audio; audio_path and gain_db are not supported.")
+
     # Load media
     video = VideoFileClip(video_path)
     clips = []
@@ -0,0 +1,87 @@
+import os
+import re
+import subprocess
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Integrated loudness target (podcast/streaming norm) and the true-peak ceiling
+# the gain may not push the signal above.
+LOUDNESS_TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET_LUFS", "-16"))
+LOUDNESS_TRUE_PEAK_DBTP = float(os.getenv("LOUDNESS_TRUE_PEAK_DBTP", "-1.5"))
+
+# Measurement filter. Added as a side branch of an existing decode, so
+# measuring costs no extra pass over the file.
+EBUR128_FILTER = "ebur128=peak=true"
+
+# ebur128 reports this for silence; there's nothing to normalize then.
+_SILENCE_LUFS = -70.0
+
+_SUMMARY_FIELDS = {
+    "integrated_lufs": re.compile(r"^\s*I:\s*(-?[\d.]+|-inf) LUFS", re.MULTILINE),
+    "loudness_range_lu": re.compile(r"^\s*LRA:\s*(-?[\d.]+) LU$", re.MULTILINE),
+    "true_peak_dbtp": re.compile(r"^\s*Peak:\s*(-?[\d.]+|-inf) dBFS", re.MULTILINE),
+}
+
+
+def parse_ebur128_summary(ffmpeg_stderr: str) -> dict:
+    """
+    Pulls integrated loudness, loudness range and true peak out of the summary
+    block ebur128 prints to stderr when the stream ends.
+    """
+    summary = ffmpeg_stderr[ffmpeg_stderr.rfind("Summary:"):]
+    if "Summary:" not in summary:
+        raise ValueError("No ebur128 summary found in FFmpeg output.")
+
+    measurement = {}
+    for field, pattern in _SUMMARY_FIELDS.items():
+        match = pattern.search(summary)
+        if match:
+            measurement[field] = float(match.group(1))
+    if "integrated_lufs" not in measurement:
+        raise ValueError("ebur128 summary has no integrated loudness.")
+    return measurement
+
+
+def measure_loudness(media_path: str) -> dict:
+    """
+    Measures a file's loudness in a decode-only pass. Prefer measuring as a
+    side branch of a decode that happens anyway (see extract_audio_from_video).
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats",
+        "-i", str(media_path),
+        "-vn", "-map", "0:a:0",
+        "-af", EBUR128_FILTER,
+        "-f", "null", "-"
+    ]
+    try:
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print("❌ FFmpeg loudness measurement failed.")
+        print(f"FFmpeg stderr:\n{e.stderr}")
+        raise
+    return parse_ebur128_summary(result.stderr)
+
+
+def compute_gain_db(
+    measurement: dict,
+    target_lufs: float = LOUDNESS_TARGET_LUFS,
+    true_peak_dbtp: float = LOUDNESS_TRUE_PEAK_DBTP,
+) -> float:
+    """
+    Linear gain (dB) that brings the measured integrated loudness to
+    `target_lufs`, reduced where needed so the true peak stays under
+    `true_peak_dbtp`. A plain gain keeps dynamics intact, unlike loudnorm's
+    dynamic mode, and can be applied in whatever encode comes last.
+    """
+    integrated = measurement.get("integrated_lufs")
+    if integrated is None or integrated <= _SILENCE_LUFS:
+        return 0.0
+
+    gain = target_lufs - integrated
+    peak = measurement.get("true_peak_dbtp")
+    if peak is not None and peak > float("-inf"):
+        gain = min(gain, true_peak_dbtp - peak)
+    return round(gain, 2)
@@ -0,0 +1,306 @@
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from src.media.service import get_media_duration, probe_audio_stream
+from src.progress import progress_active, report_progress
+
+# Frames pulled from the decoder per block. Peak memory is a few blocks,
+# independent of the file's length.
+PIPELINE_BLOCK_FRAMES = 65536
+
+# Default encode: 16-bit PCM WAV, like extract_audio_from_video.
+WAV_OUTPUT_ARGS = ["-c:a", "pcm_s16le", "-f", "wav"]
+
+# Frame position standing in for "until the end of the stream".
+OPEN_END = sys.maxsize
+
+
+def raised_cosine(length: int) -> np.ndarray:
+    """Fade-in ramp from 0 to 1 over `length` samples (reverse it to fade out)."""
+    return 0.5 - 0.5 * np.cos(np.linspace(0.0, np.pi, length, dtype=np.float32))
+
+
+class Stage:
+    """
+    One step of an AudioPipeline. Blocks are float32 arrays shaped
+    (frames, channels); a stage may return fewer or more frames than it was
+    given (e.g. cutting, or holding audio back for an overlap), as long as
+    everything comes out in order by the time `flush()` returns.
+    """
+
+    def setup(self, sample_rate: int, channels: int):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def flush(self) -> np.ndarray:
+        return np.zeros((0, self.channels), dtype=np.float32)
+
+
+class DenoiseStage(Stage):
+    """Local spectral-gate noise reduction (see SpectralGateDenoiser)."""
+
+    def __init__(self, **denoiser_kwargs):
+        self.denoiser_kwargs = denoiser_kwargs
+
+    def setup(self, sample_rate: int, channels: int):
+        from src.preprocessing.denoiser import SpectralGateDenoiser
+
+        super().setup(sample_rate, channels)
+        self.denoiser = SpectralGateDenoiser(sample_rate, channels, **self.denoiser_kwargs)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return self.denoiser.process(block)
+
+    def flush(self) -> np.ndarray:
+        return self.denoiser.flush()
+
+
+class GainStage(Stage):
+    """Applies a fixed gain in dB."""
+
+    def __init__(self, gain_db: float):
+        self.gain = np.float32(10 ** (gain_db / 20))
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return block * self.gain
+
+
+class _IntervalStage(Stage):
+    """Tracks the absolute sample position of each block against a list of (start, end) seconds."""
+
+    def __init__(self, intervals: list[tuple], fade_duration: float):
+        self.intervals = sorted(intervals)
+        self.fade_duration = fade_duration
+
+    def setup(self, sample_rate: int, channels: int):
+        super().setup(sample_rate, channels)
+        self.position = 0
+        self.spans = [(self._to_frame(start), self._to_frame(end))
+                      for start, end in self.intervals if end > start]
+        self.fade = int(self.fade_duration * sample_rate)
+
+    def _to_frame(self, seconds: float) -> int:
+        # An interval ending at float("inf") runs to the end of the stream.
+        return OPEN_END if seconds == float("inf") else int(round(seconds * self.sample_rate))
+
+    def _fade_edges(self, piece: np.ndarray, piece_start: int, span: tuple[int, int]):
+        """Fades `piece` (which starts at absolute `piece_start`) in at span[0] and out at span[1]."""
+        span_start, span_end = span
+        if span_end == OPEN_END:
+            span_end = None
+        fade = self.fade if span_end is None else min(self.fade, (span_end - span_start) // 2)
+        if not fade:
+            return
+        ramp = raised_cosine(fade)[:, None]
+        piece_end = piece_start + len(piece)
+
+        lo, hi = max(piece_start, span_start), min(piece_end, span_start + fade)
+        if lo < hi:
+            piece[lo - piece_start:hi - piece_start] *= ramp[lo - span_start:hi - span_start]
+        if span_end is not None:
+            lo, hi = max(piece_start, span_end - fade), min(piece_end, span_end)
+            if lo < hi:
+                piece[lo - piece_start:hi - piece_start] *= ramp[::-1][lo - (span_end - fade):hi - (span_end - fade)]
+
+
+class CutStage(_IntervalStage):
+    """
+    Keeps only `keep_intervals` (seconds) of the stream and drops the rest,
+    with a short raised-cosine fade on each side of every join.
+    """
+
+    def __init__(self, keep_intervals: list[tuple], fade_duration: float = 0.01):
+        super().__init__(keep_intervals, fade_duration)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block_start, block_end = self.position, self.position + len(block)
+        self.position = block_end
+
+        kept = []
+        while self.spans and self.spans[0][1] <= block_start:
+            self.spans.pop(0)
+        for span_start, span_end in self.spans:
+            if span_start >= block_end:
+                break
+            lo, hi = max(block_start, span_start), min(block_end, span_end)
+            piece = block[lo - block_start:hi - block_start].copy()
+            self._fade_edges(piece, lo, (span_start, span_end))
+            kept.append(piece)
+        if not kept:
+            return block[:0]
+        return np.concatenate(kept) if len(kept) > 1 else kept[0]
+
+
+class MuteStage(_IntervalStage):
+    """
+    Silences `mute_intervals` (seconds) in place, keeping the timeline intact
+    (e.g. so audio stays in sync with untouched video), with short fades.
+    """
+
+    def __init__(self, mute_intervals: list[tuple], fade_duration: float = 0.01):
+        super().__init__(mute_intervals, fade_duration)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block_start, block_end = self.position, self.position + len(block)
+        self.position = block_end
+
+        block = block.copy()
+        while self.spans and self.spans[0][1] + self.fade <= block_start:
+            self.spans.pop(0)
+        for span_start, span_end in self.spans:
+            if span_start - self.fade >= block_end:
+                break
+            # Fade out over the `fade` samples before the span and back in after it.
+            gains = np.ones(len(block), dtype=np.float32)
+            fade_out = (span_start - self.fade, span_start)
+            fade_in = (span_end, span_end + self.fade)
+            lo, hi = max(block_start, span_start), min(block_end, span_end)
+            if lo < hi:
+                gains[lo - block_start:hi - block_start] = 0
+            if self.fade:
+                ramp = raised_cosine(self.fade)
+                for (edge_start, edge_end), curve in ((fade_out, ramp[::-1]), (fade_in, ramp)):
+                    lo, hi = max(block_start, edge_start), min(block_end, edge_end)
+                    if lo < hi:
+                        gains[lo - block_start:hi - block_start] *= curve[lo - edge_start:hi - edge_start]
+            block *= gains[:, None]
+        return block
+
+
+class FadeStage(Stage):
+    """Fades the whole stream in at the start and out at the end."""
+
+    def __init__(self, fade_in: float = 0.0, fade_out: float = 0.0):
+        self.fade_in_duration = fade_in
+        self.fade_out_duration = fade_out
+
+    def setup(self, sample_rate: int, channels: int):
+        super().setup(sample_rate, channels)
+        self.fade_in = int(self.fade_in_duration * sample_rate)
+        self.fade_out = int(self.fade_out_duration * sample_rate)
+        self.position = 0
+        # The end isn't known until flush(), so the last `fade_out` frames are held back.
+        self.tail = np.zeros((0, channels), dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = block.copy()
+        if self.position < self.fade_in:
+            n = min(self.fade_in - self.position, len(block))
+            block[:n] *= raised_cosine(self.fade_in)[self.position:self.position + n, None]
+        self.position += len(block)
+
+        if not self.fade_out:
+            return block
+        self.tail = np.concatenate([self.tail, block])
+        ready = len(self.tail) - self.fade_out
+        if ready <= 0:
+            return block[:0]
+        out, self.tail = self.tail[:ready], self.tail[ready:]
+        return out
+
+    def flush(self) -> np.ndarray:
+        tail = self.tail
+        if len(tail):
+            tail *= raised_cosine(len(tail))[::-1, None]
+        self.tail = np.zeros((0, self.channels), dtype=np.float32)
+        return tail
+
+
+class AudioPipeline:
+    """
+    Streams audio from an FFmpeg decode pipe through a chain of stages and
+    into an FFmpeg encode pipe, one fixed-size float32 block at a time.
+
+        AudioPipeline([DenoiseStage(), CutStage(keep)]).run("in.mp4", "out.wav")
+
+    Any format FFmpeg can read works as input (including video files, whose
+    first audio stream is used). `sample_rate`/`channels` resample/remix on
+    decode; by default the input's own are kept.
+    """
+
+    def __init__(self, stages: list[Stage], sample_rate: int = None, channels: int = None,
+                 block_frames: int = PIPELINE_BLOCK_FRAMES):
+        self.stages = stages
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+
+    def _push(self, block: np.ndarray, stages: list[Stage]) -> np.ndarray:
+        for stage in stages:
+            if not len(block):
+                break
+            block = stage.process(block)
+        return block
+
+    def _flush(self, encoder) -> int:
+        """Flushes each stage in order, running its tail through the stages after it."""
+        written = 0
+        for i, stage in enumerate(self.stages):
+            tail = self._push(stage.flush(), self.stages[i + 1:])
+            if len(tail):
+                encoder.stdin.write(np.ascontiguousarray(tail, dtype=np.float32).tobytes())
+                written += len(tail)
+        return written
+
+    def run(self, input_path: str, output_path: str, output_args: list[str] = None) -> str:
+        if not self.sample_rate or not self.channels:
+            stream = probe_audio_stream(str(input_path))
+            if not stream:
+                raise ValueError(f"No audio stream found in '{input_path}'.")
+        sample_rate = self.sample_rate or stream["sample_rate"]
+        channels = self.channels or stream["channels"]
+
+        for stage in self.stages:
+            stage.setup(sample_rate, channels)
+
+        pcm_args = ["-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels)]
+        decode_cmd = ["ffmpeg", "-v", "error", "-i", str(input_path), "-vn", "-map", "0:a:0",
+                      "-c:a", "pcm_f32le"] + pcm_args + ["pipe:1"]
+        encode_cmd = ["ffmpeg", "-v", "error", "-y"] + pcm_args + ["-i", "pipe:0"] \
+            + (output_args or WAV_OUTPUT_ARGS) + [str(output_path)]
+
+        frame_bytes = 4 * channels
+        frames_in = frames_out = 0
+        total_seconds = get_media_duration(str(input_path)) if progress_active() else None
+        with tempfile.TemporaryFile() as decode_log, tempfile.TemporaryFile() as encode_log:
+            decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=decode_log)
+            encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=encode_log)
+            try:
+                while True:
+                    data = decoder.stdout.read(self.block_frames * frame_bytes)
+                    if not data:
+                        break
+                    usable = len(data) - len(data) % frame_bytes
+                    block = np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, channels)
+                    frames_in += len(block)
+                    if total_seconds:
+                        report_progress(frames_in / sample_rate, total_seconds)
+                    block = self._push(block, self.stages)
+                    if len(block):
+                        encoder.stdin.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+                        frames_out += len(block)
+                frames_out += self._flush(encoder)
+            except BrokenPipeError:
+                pass
+            finally:
+                encoder.stdin.close()
+                decoder.stdout.close()
+                decode_code, encode_code = decoder.wait(), encoder.wait()
+
+            for name, code, log in (("decode", decode_code, decode_log), ("encode", encode_code, encode_log)):
+                if code != 0:
+                    log.seek(0)
+                    stderr = log.read().decode(errors="replace")
+                    print(f"❌ FFmpeg {name} pipe failed. Exit code: {code}")
+                    print(f"FFmpeg stderr:\n{stderr}")
+                    raise subprocess.CalledProcessError(code, decode_cmd if name == "decode" else encode_cmd, stderr=stderr)
+
+        print(f"Audio pipeline: {frames_in / sample_rate:.1f}s in, {frames_out / sample_rate:.1f}s out "
+              f"through {len(self.stages)} stage(s).")
+        return str(output_path)
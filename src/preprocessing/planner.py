@@ -0,0 +1,189 @@
+import os
+from typing import Awaitable, Callable
+
+from src.media.service import extract_audio_from_video, replace_audio_in_video
+from src.preprocessing.denoiser import resolve_denoise_engine, denoise_audio_locally
+from src.preprocessing.filler import get_filler_timestamps_from_audio, remove_filler_words_smooth, \
+    resolve_filler_detection, resolve_cut_engine
+from src.preprocessing.loudness import compute_gain_db
+from src.progress import set_stage
+
+# Working audio is extracted once at a delivery-quality rate; transcription
+# resamples it in-process, so the same file serves detection and the final mux.
+WORKING_SAMPLE_RATE = 48000
+
+
+class VideoJobPlan:
+    """
+    The operations a video job needs, decided up front from its options:
+
+        extract (+ loudness) → denoise → detect fillers → render
+
+    Only the steps the options ask for are planned, and the render is always a
+    single FFmpeg pass that cuts the video, swaps in the processed audio and
+    applies the loudness gain together.
+
+    Every option value is validated here (ValueError), before any work is done.
+    """
+
+    def __init__(self, options: dict, loudness: dict | None = None):
+        self.denoise_engine = resolve_denoise_engine(options) if options.get("denoise") else None
+        self.remove_fillers = bool(options.get("removeFillers"))
+        self.filler_detection = resolve_filler_detection(options)
+        self.cut_engine = resolve_cut_engine(options)
+        self.normalize_loudness = bool(options.get("normalizeLoudness"))
+        self.loudness = loudness
+        self.measure_loudness = self.normalize_loudness and loudness is None
+
+        self.operations = []
+        if self.denoise_engine or self.remove_fillers or self.measure_loudness:
+            self.operations.append("extract+measure" if self.measure_loudness else "extract")
+        if self.denoise_engine:
+            self.operations.append(f"denoise:{self.denoise_engine}")
+        if self.remove_fillers:
+            self.operations.append(f"detect_fillers:{self.filler_detection}")
+        if self.remove_fillers or self.denoise_engine or self.normalize_loudness:
+            self.operations.append(f"render:{self.cut_engine}" if self.remove_fillers else "render:mux")
+
+    @property
+    def stages(self) -> list[str]:
+        """Progress/checkpoint stage names of the planned operations, in order."""
+        names = {"extract": "extract", "denoise": "denoise", "detect_fillers": "transcribe", "render": "render"}
+        return [names[op.split(":")[0].split("+")[0]] for op in self.operations]
+
+    def describe(self) -> str:
+        return " → ".join(self.operations) or "nothing to do"
+
+
+class VideoJobRunner:
+    """
+    Executes a VideoJobPlan and counts the full FFmpeg decode/encode passes
+    it makes over the media (`ffmpeg_passes`), so the savings are visible
+    per job. Intermediate audio lives in a single WAV in `work_dir`.
+
+    `remote_denoise` is awaited with the working audio path and must return
+    the path of the denoised file; it's used for the Cleanvoice engine.
+
+    With `checkpoints` (a JobCheckpoints), each step's output is saved as it
+    completes and steps completed by an earlier attempt are skipped.
+    """
+
+    def __init__(self, plan: VideoJobPlan, video_path: str, work_dir: str,
+                 remote_denoise: Callable[[str], Awaitable[str]] = None,
+                 checkpoints=None):
+        self.plan = plan
+        self.video_path = video_path
+        self.work_dir = work_dir
+        self.remote_denoise = remote_denoise
+        self.checkpoints = checkpoints
+        self.ffmpeg_passes = 0
+        self.loudness = plan.loudness
+
+    def _resume(self, stage: str) -> bool:
+        """Restores a stage completed by an earlier attempt; False if it still has to run."""
+        if self.checkpoints is None or not self.checkpoints.done(stage):
+            return False
+        data = self.checkpoints.data(stage)
+        self.ffmpeg_passes = max(self.ffmpeg_passes, data.get("ffmpeg_passes", 0))
+        print(f"⏩ Resuming after completed stage '{stage}'.")
+        return True
+
+    def _checkpoint(self, stage: str, artifact_path: str | None, **data) -> str | None:
+        if self.checkpoints is None:
+            return artifact_path
+        return self.checkpoints.save(stage, artifact_path, ffmpeg_passes=self.ffmpeg_passes, **data)
+
+    def _extract(self) -> str:
+        output_path = os.path.join(self.work_dir, "audio_working.wav")
+        result = extract_audio_from_video(
+            self.video_path, output_path,
+            measure_loudness=self.plan.measure_loudness,
+            sample_rate=WORKING_SAMPLE_RATE,
+            channels=None
+        )
+        if result is None:
+            raise RuntimeError("Audio extraction failed.")
+        self.ffmpeg_passes += 1
+        if self.plan.measure_loudness:
+            result, self.loudness = result
+        return result
+
+    async def _denoise(self, audio_path: str) -> str:
+        if self.plan.denoise_engine == "local":
+            self.ffmpeg_passes += 1
+            return denoise_audio_locally(audio_path, os.path.join(self.work_dir, "audio_denoised.wav"))
+        if self.remote_denoise is None:
+            raise ValueError(f"No remote denoiser given for engine '{self.plan.denoise_engine}'.")
+        return await self.remote_denoise(audio_path)
+
+    def _render(self, audio_path: str | None, filler_times: list, gain_db: float) -> str:
+        if self.plan.remove_fillers and self.plan.cut_engine != "moviepy":
+            self.ffmpeg_passes += 1
+            return remove_filler_words_smooth(
+                self.video_path, filler_times,
+                output_path=os.path.join(self.work_dir, "video_rendered.mp4"),
+                engine=self.plan.cut_engine,
+                audio_path=audio_path,
+                gain_db=gain_db
+            )
+
+        video_path = self.video_path
+        if self.plan.remove_fillers:
+            # MoviePy can only cut the video's own audio, so the processed
+            # track has to be muxed in first: two extra passes.
+            if audio_path:
+                video_path = replace_audio_in_video(video_path, audio_path, self.work_dir)
+                self.ffmpeg_passes += 1
+            video_path = remove_filler_words_smooth(video_path, filler_times, engine="moviepy")
+            self.ffmpeg_passes += 1
+            if not gain_db:
+                return video_path
+            audio_path = None
+
+        self.ffmpeg_passes += 1
+        if audio_path is None:
+            audio_path = video_path
+        return replace_audio_in_video(video_path, audio_path, self.work_dir, gain_db=gain_db)
+
+    async def run(self) -> str:
+        """Returns the path of the finished video (the input itself if there was nothing to do)."""
+        print(f"Video job plan: {self.plan.describe()}")
+        if not self.plan.operations:
+            return self.video_path
+        if self._resume("render"):
+            return self.checkpoints.artifact("render")
+
+        audio_path = None
+        if self.plan.operations[0].startswith("extract"):
+            if self._resume("extract"):
+                audio_path = self.checkpoints.artifact("extract")
+                self.loudness = self.checkpoints.data("extract").get("loudness") or self.loudness
+            else:
+                set_stage("extract")
+                audio_path = self._checkpoint("extract", self._extract(), loudness=self.loudness)
+
+        denoised = False
+        if self.plan.denoise_engine:
+            if self._resume("denoise"):
+                audio_path = self.checkpoints.artifact("denoise")
+            else:
+                set_stage("denoise")
+                audio_path = self._checkpoint("denoise", await self._denoise(audio_path))
+            denoised = True
+
+        filler_times = []
+        if self.plan.remove_fillers:
+            if self._resume("transcribe"):
+                filler_times = self.checkpoints.data("transcribe")["filler_times"]
+            else:
+                set_stage("transcribe")
+                filler_times = get_filler_timestamps_from_audio(audio_path, mode=self.plan.filler_detection)
+                self._checkpoint("transcribe", None, filler_times=filler_times)
+
+        set_stage("render")
+        gain_db = compute_gain_db(self.loudness) if self.plan.normalize_loudness and self.loudness else 0.0
+        # Undenoised working audio is identical to the video's own track, which the render can read directly.
+        output_path = self._render(audio_path if denoised else None, filler_times, gain_db)
+        output_path = self._checkpoint("render", output_path)
+        print(f"Video job finished in {self.ffmpeg_passes} FFmpeg pass(es).")
+        return output_path
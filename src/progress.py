@@ -0,0 +1,157 @@
+import json
+import time
+from contextvars import ContextVar, Token
+
+import redis
+from celery import current_task
+
+from src.cache import get_redis, get_async_redis
+
+# Published at most this often per job (stage changes are always published).
+PROGRESS_MIN_INTERVAL = 1.0
+# Progress outlives the job a while, so a client polling late still sees the end.
+PROGRESS_TTL = 24 * 3600
+
+
+def _progress_key(kind: str, job_id: int) -> str:
+    return f"progress:{kind}:{job_id}"
+
+
+def progress_channel(kind: str, job_id: int) -> str:
+    """Redis pub/sub channel every published state of the job is sent on."""
+    return f"progress-events:{kind}:{job_id}"
+
+
+class JobProgress:
+    """
+    Stage-level progress of one job, kept in Redis (never in the database),
+    published on its progress_channel() and mirrored to the Celery task state:
+
+        {"status": "PROCESSING", "stage": "render", "stage_index": 4, "stage_count": 6,
+         "stage_percent": 41.5, "percent": 73.6, "eta_seconds": 52,
+         "timings": {"download": 3.1, ...}, "updated_at": ...}
+
+    Updates are throttled to one per PROGRESS_MIN_INTERVAL, so reporting
+    from a tight loop (FFmpeg -progress lines, Whisper segments) is cheap.
+    Status changes and stage changes are always published.
+    """
+
+    def __init__(self, kind: str, job_id: int, stages: list[str]):
+        self.key = _progress_key(kind, job_id)
+        self.channel = progress_channel(kind, job_id)
+        self.stages = stages
+        self.state = {"stage": None, "stage_index": 0, "stage_count": len(stages),
+                      "stage_percent": 0.0, "percent": 0.0, "eta_seconds": None, "timings": {}}
+        self._stage_started = None
+        self._last_publish = 0.0
+        # A retry or the next task of a chain keeps the timings recorded so far.
+        previous = get_job_progress(kind, job_id)
+        if previous:
+            self.state["timings"] = previous.get("timings", {})
+
+    def _publish(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_publish < PROGRESS_MIN_INTERVAL:
+            return
+        self._last_publish = now
+        self.state["updated_at"] = now
+        payload = json.dumps(self.state)
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.set(self.key, payload, ex=PROGRESS_TTL)
+            pipe.publish(self.channel, payload)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"⚠️ Could not publish progress: {e}")
+
+        if current_task and current_task.request.id:
+            try:
+                current_task.update_state(state="PROGRESS", meta=self.state)
+            except Exception:
+                pass
+
+    def _close_stage(self):
+        if self.state["stage"] is not None and self._stage_started is not None:
+            self.state["timings"][self.state["stage"]] = round(time.monotonic() - self._stage_started, 2)
+
+    def stage(self, name: str):
+        """Starts stage `name`; the previous stage's wall time goes into "timings"."""
+        self._close_stage()
+        index = self.stages.index(name) if name in self.stages else self.state["stage_index"]
+        self.state.update(stage=name, stage_index=index, stage_percent=0.0, eta_seconds=None,
+                          percent=round(100 * index / max(1, len(self.stages)), 1))
+        self._stage_started = time.monotonic()
+        self._publish(force=True)
+
+    def update(self, done: float, total: float):
+        """Reports `done` out of `total` (e.g. seconds of media) for the current stage."""
+        if not total or self._stage_started is None:
+            return
+        fraction = min(1.0, max(0.0, done / total))
+        elapsed = time.monotonic() - self._stage_started
+        self.state["stage_percent"] = round(100 * fraction, 1)
+        self.state["percent"] = round(100 * (self.state["stage_index"] + fraction) / max(1, len(self.stages)), 1)
+        self.state["eta_seconds"] = round(elapsed * (1 - fraction) / fraction) if fraction > 0.01 else None
+        self._publish()
+
+    def set_status(self, status: str, **fields):
+        """Publishes a status transition (the value just written to the job's record)."""
+        self.state.update(status=status, **fields)
+        self._publish(force=True)
+
+    def finish(self, status: str, **fields):
+        """Ends the job with `status`; `fields` (e.g. public_url, error) ride along."""
+        self._close_stage()
+        self.state.update(stage=None, eta_seconds=None)
+        if status == "COMPLETED":
+            self.state.update(stage_percent=100.0, percent=100.0)
+        self.set_status(status, **fields)
+
+
+_current_progress: ContextVar[JobProgress | None] = ContextVar("current_progress", default=None)
+
+
+def start_tracking(progress: JobProgress) -> Token:
+    """
+    Makes `progress` the target of set_stage()/report_progress() calls made
+    in this context (thread or task). Pass the token to stop_tracking() when
+    the job ends, so a pooled thread doesn't report into a finished job.
+    """
+    return _current_progress.set(progress)
+
+
+def stop_tracking(token: Token):
+    _current_progress.reset(token)
+
+
+def progress_active() -> bool:
+    return _current_progress.get() is not None
+
+
+def set_stage(name: str):
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.stage(name)
+
+
+def report_progress(done: float, total: float):
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.update(done, total)
+
+
+def get_job_progress(kind: str, job_id: int) -> dict | None:
+    try:
+        state = get_redis().get(_progress_key(kind, job_id))
+    except redis.RedisError:
+        return None
+    return json.loads(state) if state else None
+
+
+async def get_job_progress_async(kind: str, job_id: int) -> dict | None:
+    """get_job_progress() for the API's event loop."""
+    try:
+        state = await get_async_redis().get(_progress_key(kind, job_id))
+    except redis.RedisError:
+        return None
+    return json.loads(state) if state else None
@@ -2,13 +2,13 @@ from pathlib import Path
 from typing import List
 
 from openai import AzureOpenAI
-from faster_whisper import WhisperModel
 from dotenv import load_dotenv
 import os
 import re
 import json
 
 from src.shorts.ai.schemas import Moment, AllMoments
+from src.transcription.service import transcribe
 
 load_dotenv()
 
@@ -25,36 +25,15 @@ client = AzureOpenAI(
 #
 def transcribe_audio(file_path: Path, model_size: str, compute_type: str = "float32") -> dict:
     try:
-        model = WhisperModel(model_size, compute_type=compute_type)
-
-        segments, info = model.transcribe(
-            file_path,
-            initial_prompt="Transcribe everything exactly as spoken.",
-            vad_filter=False,
-            suppress_tokens=[],
-            beam_size=5,
-            word_timestamps=True,
-            condition_on_previous_text=False
-        )
+        transcript = transcribe(file_path, model_size, compute_type=compute_type)
 
         # sentence-level output
-        sentences = []
-        full_text = []
-
-        for segment in segments:
-            if segment.text:
-                sentence = segment.text.strip()
-                sentences.append({
-                    "start": round(segment.start, 2),
-                    "end": round(segment.end, 2),
-                    "text": sentence
-                })
-                full_text.append(sentence)
+        sentences = transcript.sentences()
 
         return {
-            "full_text": " ".join(full_text),  # joined string
-            "language": info.language,
-            "language_probability": round(info.language_probability, 3),
+            "full_text": " ".join(s["text"] for s in sentences),  # joined string
+            "language": transcript.language,
+            "language_probability": round(transcript.language_probability, 3),
             "sentences": sentences  # list of sentence chunks with timestamps
         }
 
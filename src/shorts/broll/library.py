@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.media.parallel_render import encode_rendition, rendition_key
+from src.media.service import get_media_duration
+
+load_dotenv()
+
+BROLL_LIBRARY_DIR = os.getenv("BROLL_LIBRARY_DIR", "/tmp/shushu_broll_library")
+# Disk budget for the whole library; least recently used clips go first.
+BROLL_LIBRARY_MAX_BYTES = int(os.getenv("BROLL_LIBRARY_MAX_BYTES", str(5 * 1024 ** 3)))
+# Renditions cover the start of a clip only; insertions are a few seconds long.
+BROLL_RENDITION_SECONDS = float(os.getenv("BROLL_RENDITION_SECONDS", "10"))
+# Clips used more recently than this are never evicted (a job may be about to read them).
+BROLL_LIBRARY_MIN_IDLE_SECONDS = 600
+
+
+def clip_key(video: dict) -> str:
+    """
+    Library key for a search result: its Pexels video and file ids, or a
+    hash of the download URL for results that don't carry them.
+    """
+    if video.get("video_id") is not None and video.get("file_id") is not None:
+        return f"pexels_{video['video_id']}_{video['file_id']}"
+    return "url_" + hashlib.sha1(video["download_url"].encode()).hexdigest()[:16]
+
+
+class BrollLibrary:
+    """
+    Persistent on-disk store of stock clips shared by all jobs on a machine:
+
+        <root>/<clip key>/original.mp4
+        <root>/<clip key>/rendition_<width>x<height>_<fps>_<encoder>.ts
+        <root>/<clip key>/meta.json
+
+    A rendition is the clip's first BROLL_RENDITION_SECONDS encoded with the
+    parallel renderer's exact segment settings, so assembling at the same
+    output size and frame rate stream-copies it instead of re-encoding.
+    Every write goes to a temporary name unique to the writer first, so
+    concurrent workers (processes or threads) never see or share partial files.
+
+    The original may cover only the start of the stock clip (meta.json
+    "original_seconds"); it is fetched again, longer, when a job needs more.
+    """
+
+    def __init__(self, root: str = BROLL_LIBRARY_DIR, max_bytes: int = BROLL_LIBRARY_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _clip_dir(self, key: str) -> Path:
+        return self.root / key
+
+    def _touch(self, key: str):
+        # The clip directory's mtime is its last use, which eviction orders by.
+        try:
+            os.utime(self._clip_dir(key))
+        except FileNotFoundError:
+            pass
+
+    def _read_meta(self, key: str) -> dict:
+        try:
+            return json.loads((self._clip_dir(key) / "meta.json").read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"renditions": {}}
+
+    def _write_meta(self, key: str, meta: dict):
+        tmp_path = self._clip_dir(key) / f"meta.json.{uuid.uuid4().hex}"
+        tmp_path.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp_path, self._clip_dir(key) / "meta.json")
+
+    def original_path(self, key: str, min_seconds: float = None) -> Path | None:
+        """
+        The clip's stored original, or None if it isn't stored or (given
+        `min_seconds`) only its first part was fetched and that's too short.
+        """
+        path = self._clip_dir(key) / "original.mp4"
+        if not path.exists():
+            return None
+        covered = self._read_meta(key).get("original_seconds")
+        if min_seconds is not None and covered is not None and covered < min_seconds:
+            return None
+        self._touch(key)
+        return path
+
+    def partial_path(self, key: str) -> Path:
+        """Where to download a clip before handing it to add_original()."""
+        self._clip_dir(key).mkdir(parents=True, exist_ok=True)
+        return self._clip_dir(key) / f"original.mp4.part{uuid.uuid4().hex}"
+
+    def add_original(self, key: str, downloaded_path: Path, source: dict = None, seconds: float = None) -> Path:
+        """
+        Stores a downloaded clip. `seconds` is how much of the clip it covers
+        when only its start was fetched; None means the whole clip.
+        """
+        path = self._clip_dir(key) / "original.mp4"
+        os.replace(downloaded_path, path)
+        meta = self._read_meta(key)
+        meta["original_seconds"] = seconds
+        # Renditions of an earlier, shorter original are rebuilt on next use.
+        for name in meta.get("renditions", {}):
+            (self._clip_dir(key) / f"rendition_{name}.ts").unlink(missing_ok=True)
+        meta["renditions"] = {}
+        if source:
+            meta["source"] = {k: source.get(k) for k in ("video_id", "file_id", "download_url", "width", "height")}
+        self._write_meta(key, meta)
+        self._touch(key)
+        self.evict()
+        return path
+
+    def key_for_path(self, path: str) -> str | None:
+        """The clip key of a path inside the library, or None for any other file."""
+        try:
+            relative = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        return relative.parts[0] if len(relative.parts) > 1 else None
+
+    def rendition_for(self, broll_path: str, width: int, height: int, fps: str,
+                      seconds: float = None) -> tuple | None:
+        """
+        (rendition_path, seconds) for a library clip at these output settings,
+        encoding the rendition on first use. None if the clip isn't in the
+        library, or if a slot of `seconds` is longer than any rendition covers.
+        """
+        if seconds is not None and seconds > BROLL_RENDITION_SECONDS:
+            return None
+        key = self.key_for_path(broll_path)
+        if key is None or self.original_path(key) is None:
+            return None
+
+        name = rendition_key(int(width), int(height), fps)
+        path = self._clip_dir(key) / f"rendition_{name}.ts"
+        meta = self._read_meta(key)
+        if path.exists() and name in meta["renditions"]:
+            return path, meta["renditions"][name]
+
+        print(f"▶️ Encoding {name} rendition of B-roll clip {key}...")
+        tmp_path = self._clip_dir(key) / f"rendition_{name}.ts.part{uuid.uuid4().hex}"
+        encode_rendition(str(self._clip_dir(key) / "original.mp4"), str(tmp_path),
+                         int(width), int(height), fps, BROLL_RENDITION_SECONDS)
+        covered = get_media_duration(str(tmp_path))
+        os.replace(tmp_path, path)
+
+        meta = self._read_meta(key)
+        meta["renditions"][name] = covered
+        self._write_meta(key, meta)
+        self.evict()
+        return path, covered
+
+    def evict(self):
+        """Deletes least recently used clips until the library fits in its disk budget."""
+        clips = []
+        total = 0
+        for clip_dir in self.root.iterdir():
+            try:
+                if not clip_dir.is_dir():
+                    continue
+                size = sum(f.stat().st_size for f in clip_dir.iterdir() if f.is_file())
+                clips.append((clip_dir.stat().st_mtime, size, clip_dir))
+            except FileNotFoundError:
+                # Evicted by another worker meanwhile.
+                continue
+            total += size
+
+        now = time.time()
+        for last_used, size, clip_dir in sorted(clips):
+            if total <= self.max_bytes:
+                break
+            if now - last_used < BROLL_LIBRARY_MIN_IDLE_SECONDS:
+                continue
+            shutil.rmtree(clip_dir, ignore_errors=True)
+            total -= size
+            print(f"🗑️ Evicted B-roll clip {clip_dir.name} ({size / 1024 ** 2:.1f} MB) from the library.")
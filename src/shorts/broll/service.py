@@ -1,62 +1,220 @@
 import asyncio
+import json
 from pathlib import Path
 import subprocess
+import time
 import httpx
 from dotenv import load_dotenv
-import requests
+import redis
 import os
 
+from src.cache import get_redis
+from src.media.service import probe_video_stream, get_media_duration, run_ffmpeg_with_progress
+from src.media.parallel_render import assemble_broll_parallel
+from src.shorts.broll.library import BrollLibrary, clip_key, BROLL_RENDITION_SECONDS
+from src.media.smart_render import can_smart_render, smart_assemble_broll
+
 
 load_dotenv()
 
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
 PEXELS_VIDEO_URL = "https://api.pexels.com/videos/search"
+# Searches in flight at once, and how long a keyword's results are reused.
+PEXELS_MAX_CONCURRENT = int(os.getenv("PEXELS_MAX_CONCURRENT", "4"))
+PEXELS_CACHE_TTL = int(os.getenv("PEXELS_CACHE_TTL", str(24 * 3600)))
+# Requests kept in reserve: below this many left, only cached keywords are served.
+PEXELS_QUOTA_RESERVE = int(os.getenv("PEXELS_QUOTA_RESERVE", "5"))
+# A 429 asking to wait longer than this is given up on rather than slept through.
+PEXELS_MAX_RETRY_WAIT = float(os.getenv("PEXELS_MAX_RETRY_WAIT", "10"))
+# Extra seconds fetched past what an insertion needs when downloading only a clip's start.
+BROLL_DOWNLOAD_MARGIN_SECONDS = 1.0
+# "parallel" (segments re-encoded concurrently), "smart" (copy untouched
+# A-roll GOPs) or "filtergraph" (one FFmpeg run re-encodes everything).
+BROLL_ASSEMBLY_BACKEND = os.getenv("BROLL_ASSEMBLY_BACKEND", "parallel")
+
+def _pick_video_files(data: dict, keyword: str) -> list:
+    """Picks the smallest rendition up to 720px wide of each video in a Pexels search response."""
+    results = []
+    for video in data.get("videos", []):
+        # Find the video file with the highest resolution.
+        if not video.get("video_files"):
+            continue
 
-def search_broll_videos(keywords: list, orientation="portrait", max_results=1) -> list:
+        # best_file = max(video["video_files"], key=lambda f: f.get("height", 0))
+        best_file = min(
+            [f for f in video["video_files"] if f["width"] <= 720],
+            key=lambda f: f.get("height", 0),
+            default=None
+        )
+        if best_file is None:
+            continue
+
+        # We store the direct download link, not the webpage url.
+        results.append({
+            "keyword": keyword,
+            "video_id": video.get("id"),
+            "file_id": best_file.get("id"),
+            "download_url": best_file["link"],  # Use the 'link' from 'video_files'
+            "duration": video.get("duration"),
+            "width": best_file.get("width"),
+            "height": best_file.get("height")
+        })
+    return results
+
+
+def _normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+def _search_cache_key(keyword: str, orientation: str, max_results: int) -> str:
+    return f"pexels:search:{orientation}:{max_results}:{keyword}"
+
+
+def _cache_get(key: str) -> list | None:
+    try:
+        cached = get_redis().get(key)
+    except redis.RedisError as e:
+        print(f"⚠️ Search cache unavailable: {e}")
+        return None
+    return json.loads(cached) if cached is not None else None
+
+
+def _cache_set(key: str, results: list):
+    try:
+        get_redis().set(key, json.dumps(results), ex=PEXELS_CACHE_TTL)
+    except redis.RedisError as e:
+        print(f"⚠️ Search cache unavailable: {e}")
+
+
+def _header_number(headers: httpx.Headers, name: str) -> float | None:
+    """A numeric response header, or None if it's missing or malformed."""
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class PexelsRateLimit:
     """
-    Searches Pexels for videos and returns a list of dictionaries containing
-    the direct link to the highest quality video file.
+    Quota state from Pexels' X-Ratelimit-* response headers, shared across
+    workers through Redis so one worker's usage is visible to the others.
     """
-    headers = {"Authorization": PEXELS_API_KEY}
-    results = []
 
-    for keyword in keywords:
-        params = {
-            "query": keyword,
-            "orientation": orientation,
-            "per_page": max_results
-        }
+    KEY = "pexels:ratelimit"
+
+    def update(self, headers: httpx.Headers):
+        remaining = _header_number(headers, "X-Ratelimit-Remaining")
+        reset = _header_number(headers, "X-Ratelimit-Reset")
+        if remaining is None or reset is None:
+            return
+        ttl = max(1, int(reset) - int(time.time()))
         try:
-            res = requests.get("https://api.pexels.com/videos/search", params=params, headers=headers)
-            res.raise_for_status()  # Check for HTTP errors
+            get_redis().set(self.KEY, json.dumps({"remaining": int(remaining), "reset": int(reset)}), ex=ttl)
+        except redis.RedisError:
+            pass
+
+    def exhausted(self) -> bool:
+        """True while the last known remaining quota is at or below the reserve."""
+        try:
+            state = get_redis().get(self.KEY)
+        except redis.RedisError:
+            return False
+        if state is None:
+            return False
+        state = json.loads(state)
+        if state["remaining"] > PEXELS_QUOTA_RESERVE:
+            return False
+        print(f"⚠️ Pexels quota nearly exhausted ({state['remaining']} left until "
+              f"{time.strftime('%H:%M UTC', time.gmtime(state['reset']))}); serving cached results only.")
+        return True
+
+
+async def _search_keyword(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, rate_limit: PexelsRateLimit,
+                          keyword: str, orientation: str, max_results: int) -> list:
+    cache_key = _search_cache_key(keyword, orientation, max_results)
+    # Redis calls run in a thread so they don't block the other searches. The
+    # asyncio client isn't used: workers start a fresh event loop per task
+    # (asyncio.run), and a shared client stays bound to the first one.
+    cached = await asyncio.to_thread(_cache_get, cache_key)
+    if cached is not None:
+        return cached
+    if await asyncio.to_thread(rate_limit.exhausted):
+        return []
 
-            data = res.json()
-            for video in data.get("videos", []):
-                # --- THIS IS THE KEY CHANGE ---
-                # Find the video file with the highest resolution.
-                if not video.get("video_files"):
-                    continue
-
-                # best_file = max(video["video_files"], key=lambda f: f.get("height", 0))
-                best_file = min(
-                    [f for f in video["video_files"] if f["width"] <= 720],
-                    key=lambda f: f.get("height", 0),
-                    default=None
-                )
-
-                # We store the direct download link, not the webpage url.
-                results.append({
-                    "keyword": keyword,
-                    "download_url": best_file["link"],  # Use the 'link' from 'video_files'
-                    "duration": video.get("duration"),
-                    "width": best_file.get("width"),
-                    "height": best_file.get("height")
-                })
-        except requests.exceptions.RequestException as e:
+    headers = {"Authorization": PEXELS_API_KEY}
+    params = {
+        "query": keyword,
+        "orientation": orientation,
+        "per_page": max_results
+    }
+    async with semaphore:
+        try:
+            res = await client.get(PEXELS_VIDEO_URL, params=params, headers=headers)
+            await asyncio.to_thread(rate_limit.update, res.headers)
+            if res.status_code == 429:
+                # An HTTP-date Retry-After isn't worth parsing: waits that long are skipped anyway.
+                retry_after = _header_number(res.headers, "Retry-After")
+                if retry_after is None or retry_after > PEXELS_MAX_RETRY_WAIT:
+                    print(f"❌ Pexels rate limit hit for '{keyword}'; retry later.")
+                    return []
+                await asyncio.sleep(retry_after)
+                res = await client.get(PEXELS_VIDEO_URL, params=params, headers=headers)
+                await asyncio.to_thread(rate_limit.update, res.headers)
+            res.raise_for_status()  # Check for HTTP errors
+        except httpx.HTTPError as e:
             print(f"❌ Failed to fetch for '{keyword}': {e}")
+            return []
 
+    results = _pick_video_files(res.json(), keyword)
+    await asyncio.to_thread(_cache_set, cache_key, results)
     return results
 
+
+async def search_broll_for_moments(moments: list, orientation="portrait", max_results=1,
+                                   client: httpx.AsyncClient = None) -> list:
+    """
+    Searches Pexels for every keyword of every moment concurrently and returns
+    [{"timestamp", "keywords", "videos"}] in the order of `moments`.
+
+    Requests share one client, at most PEXELS_MAX_CONCURRENT run at once, and
+    results are cached per keyword in Redis for PEXELS_CACHE_TTL seconds, so a
+    keyword is looked up once however many moments (or jobs) use it.
+    """
+    keywords = list(dict.fromkeys(_normalize_keyword(k) for moment in moments for k in moment["keywords"]))
+    semaphore = asyncio.Semaphore(PEXELS_MAX_CONCURRENT)
+    rate_limit = PexelsRateLimit()
+
+    async def _search_all(search_client):
+        return await asyncio.gather(*(
+            _search_keyword(search_client, semaphore, rate_limit, keyword, orientation, max_results)
+            for keyword in keywords
+        ))
+
+    if client is None:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            found = await _search_all(client)
+    else:
+        found = await _search_all(client)
+    by_keyword = dict(zip(keywords, found))
+
+    return [{
+        "timestamp": moment["timestamp"],
+        "keywords": moment["keywords"],
+        "videos": [video for keyword in moment["keywords"]
+                   for video in by_keyword[_normalize_keyword(keyword)]]
+    } for moment in moments]
+
+
+def search_broll_videos(keywords: list, orientation="portrait", max_results=1) -> list:
+    """
+    Searches Pexels for videos and returns a list of dictionaries containing
+    the direct link to the highest quality video file.
+    """
+    matches = asyncio.run(search_broll_for_moments(
+        [{"timestamp": None, "keywords": keywords}], orientation, max_results
+    ))
+    return matches[0]["videos"]
+
 async def download_video(client: httpx.AsyncClient, url: str, save_path: Path) -> Path | None:
     try:
         async with client.stream("GET", url) as response:
@@ -74,6 +232,38 @@ async def download_video(client: httpx.AsyncClient, url: str, save_path: Path) -
         print(f"❌ Unexpected error for {url}: {e}")
     return None
 
+async def download_video_range(url: str, save_path: Path, seconds: float) -> Path | None:
+    """
+    Fetches only the first `seconds` of a remote MP4. FFmpeg reads the moov
+    atom and the leading samples with HTTP range requests and stream-copies
+    them into a new file, so the rest of the stock clip is never downloaded.
+    """
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-xerror",
+        "-t", f"{seconds:.3f}", "-i", url,
+        "-map", "0", "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4", str(save_path)
+    ]
+    process = await asyncio.create_subprocess_exec(*cmd, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        print(f"⚠️ Range download failed for {url} (exit code {process.returncode}): {stderr.decode(errors='replace')}")
+        return None
+    print(f"✅ Downloaded first {seconds:.1f}s: {save_path}")
+    return save_path
+
+
+def _slot_seconds(timestamp: str) -> float | None:
+    """Length of a '10.5-15.2' insertion slot, or None if it can't be parsed."""
+    try:
+        start, end = map(float, timestamp.split("-"))
+    except (ValueError, AttributeError):
+        return None
+    return end - start
+
+
 # async def download_broll_videos(video_data: list, save_directory: str) -> list:
 #     """
 #     Downloads one B-roll video per keyword group concurrently.
@@ -148,6 +338,67 @@ async def download_broll_videos(video_data: list, save_directory: str, max_concu
         local_file_paths = await asyncio.gather(*download_tasks)
         return [path for path in local_file_paths if path is not None]
 
+async def download_broll_to_library(video_data: list, library: BrollLibrary = None, max_concurrent=2) -> list:
+    """
+    Makes sure the first video of each group is in the B-roll library,
+    downloading only clips it doesn't have yet. Returns one library path
+    (or None if there was no video or the download failed) per group.
+
+    Only the start of a clip that a slot (plus a rendition's worth) needs is
+    fetched; the whole file is downloaded if that fails or the slot is unknown.
+    """
+    library = library or BrollLibrary()
+    download_semaphore = asyncio.Semaphore(max_concurrent)
+
+    async with httpx.AsyncClient(timeout=300.0) as client:
+        async def _fetch(video_info, slot_seconds):
+            key = clip_key(video_info)
+            path = library.original_path(key, min_seconds=slot_seconds)
+            if path is not None:
+                print(f"♻️ B-roll clip {key} found in the library.")
+                return path
+
+            partial_path = library.partial_path(key)
+            clip_seconds = video_info.get("duration")
+            fetch_seconds = None
+            if slot_seconds is not None:
+                fetch_seconds = max(slot_seconds, BROLL_RENDITION_SECONDS) + BROLL_DOWNLOAD_MARGIN_SECONDS
+                if clip_seconds and fetch_seconds >= clip_seconds:
+                    fetch_seconds = None
+            async with download_semaphore:
+                partial = None
+                if fetch_seconds is not None:
+                    partial = await download_video_range(video_info["download_url"], partial_path, fetch_seconds)
+                if partial is None:
+                    fetch_seconds = None
+                    partial = await download_video(client, video_info["download_url"], partial_path)
+            if partial is None:
+                partial_path.unlink(missing_ok=True)
+                return None
+            return library.add_original(key, partial, video_info, seconds=fetch_seconds)
+
+        # Groups that picked the same clip share one fetch, long enough for the longest slot.
+        clips = {}
+        group_keys = []
+        for group in video_data:
+            videos = group.get("videos", [])
+            if not videos or not videos[0].get("download_url"):
+                group_keys.append(None)
+                continue
+            key = clip_key(videos[0])
+            slot_seconds = _slot_seconds(group.get("timestamp"))
+            if key in clips:
+                needed = clips[key][1]
+                # An unknown slot length means the whole clip.
+                slot_seconds = None if needed is None or slot_seconds is None else max(needed, slot_seconds)
+            clips[key] = (videos[0], slot_seconds)
+            group_keys.append(key)
+
+        paths = dict(zip(clips, await asyncio.gather(
+            *(_fetch(video_info, slot_seconds) for video_info, slot_seconds in clips.values())
+        )))
+        return [paths[key] if key is not None else None for key in group_keys]
+
 # async def download_broll_videos(video_data: list, save_directory: str) -> list:
 #     Path(save_directory).mkdir(exist_ok=True)
 #     download_tasks = []
@@ -569,21 +820,68 @@ def concat_with_broll_ffmpeg_light(original_path: str, broll_insertions: list, o
 #         raise
 
 
+def parse_broll_insertions(broll_insertions: list) -> list[dict]:
+    """
+    Converts [{'timestamp': '10.5-15.2', 'broll_path': ...}] into sorted
+    [{'start', 'end', 'broll_path'}], skipping malformed timestamps.
+    """
+    parsed = []
+    for moment in broll_insertions:
+        try:
+            start_time, end_time = map(float, moment['timestamp'].split('-'))
+        except (ValueError, AttributeError):
+            continue
+        parsed.append({"start": start_time, "end": end_time, "broll_path": moment["broll_path"]})
+    return sorted(parsed, key=lambda x: x["start"])
+
+
 def assemble_video_with_broll_overlay(
         original_video_path: str,
         broll_insertions: list,
         output_path: str,
-        output_resolution: str = "1080:1920"
+        output_resolution: str = "1080:1920",
+        backend: str = BROLL_ASSEMBLY_BACKEND
 ) -> str:
     """
     Assembles a video by inserting B-roll clips at specified timestamps,
     keeping the original audio track intact. This version uses a robust
     split-and-concat filtergraph in FFmpeg to prevent frozen frames.
+
+    backend="smart" instead stream-copies every A-roll GOP that no insertion
+    touches and re-encodes only the B-roll clips and cut boundaries. It needs
+    an H.264 source already at `output_resolution`; otherwise the filtergraph
+    is used.
+
+    backend="parallel" encodes each A-roll stretch and B-roll clip as its own
+    segment, several FFmpeg processes at once, and joins them by stream copy.
+    B-roll clips from the library are stream-copied from a rendition at the
+    output settings instead of being re-encoded.
     """
     if not broll_insertions:
         # ... (handle no b-roll case) ...
         raise ValueError("No B-roll data to process.")
 
+    output_w, output_h = output_resolution.split(':')
+
+    if backend == "smart":
+        stream = probe_video_stream(original_video_path)
+        if can_smart_render(stream, int(output_w), int(output_h)):
+            print("▶️ Assembling final video with smart render...")
+            return smart_assemble_broll(
+                original_video_path, parse_broll_insertions(broll_insertions), output_path,
+                int(output_w), int(output_h)
+            )
+        print("Source can't be stream-copied at the output resolution; using the parallel backend.")
+        backend = "parallel"
+
+    if backend == "parallel":
+        print("▶️ Assembling final video with parallel segment encoding...")
+        return assemble_broll_parallel(
+            original_video_path, parse_broll_insertions(broll_insertions), output_path,
+            int(output_w), int(output_h),
+            rendition_for=BrollLibrary().rendition_for
+        )
+
     command = ['ffmpeg', '-y', '-i', original_video_path]
     for insertion in broll_insertions:
         command.extend(['-i', insertion['broll_path']])
@@ -592,8 +890,6 @@ def assemble_video_with_broll_overlay(
     concat_streams = []
     last_aroll_end_time = 0.0
 
-    output_w, output_h = output_resolution.split(':')
-
     # Sort insertions by start time to process them in order
     broll_insertions.sort(key=lambda x: float(x['timestamp'].split('-')[0]))
 
@@ -663,7 +959,7 @@ def assemble_video_with_broll_overlay(
     print("▶️ Assembling final video with FFmpeg split/concat method...")
 
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        result = run_ffmpeg_with_progress(command, get_media_duration(original_video_path))
         print(f"✅ Video assembly successful. Output saved to: {output_path}")
         return output_path
     except subprocess.CalledProcessError as e:
@@ -5,7 +5,7 @@ from src.auth.service import get_current_user
 from src.database import get_db
 from src.media.models import Video
 from src.space.service import create_resigned_upload_url
-from src.worker.tasks import start_shorts_analysis_task
+from src.worker.tasks import start_shorts_pipeline
 
 router = APIRouter(tags=["Shorts"])
 @router.get("/shorts/generate-upload-url")
@@ -47,7 +47,7 @@ def start_shorts_processing(
     #     "object_name": object_name,
     #     "user_id": user.id
     # }
-    start_shorts_analysis_task.delay(
+    start_shorts_pipeline(
         job_id=record.id,
         object_name=object_name,
         user_id=user.id
@@ -1,15 +1,28 @@
+import json
+
 from fastapi import APIRouter, HTTPException, Depends, Body, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from src.auth.models import User
-from src.auth.service import get_current_user
+from src.auth.service import get_current_user, create_stream_token, verify_stream_token, STREAM_TOKEN_EXPIRE_SECONDS
 from src.database import get_db
 from src.media.models import Video, Audio
+from src.cache import get_async_redis
+from src.progress import get_job_progress, get_job_progress_async, progress_channel
 from src.space.service import create_resigned_upload_url
-from src.worker.tasks import process_audio_task, process_video_task
+from src.worker.tasks import process_audio_task, process_video_task, start_processing_batch
 
 router = APIRouter(tags=["Processing"])
 
+# Files one batch submission may start.
+MAX_BATCH_SIZE = 100
+
+# Statuses after which a job never changes again; its event stream ends there.
+FINAL_JOB_STATUSES = ("COMPLETED", "FAILED")
+# An idle event stream sends a comment this often, so proxies don't close it.
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
 
 @router.get("/generate-upload-url")
 def generate_upload_url(filename: str, user: User = Depends(get_current_user)):
@@ -84,6 +97,58 @@ def start_processing(
     }
 
 
+@router.post("/start-processing/batch")
+def start_processing_batch_jobs(
+        object_names: list[str] = Body(..., embed=True),
+        options: dict = Body(..., embed=True),
+        db: Session = Depends(get_db),
+        user: User = Depends(get_current_user)
+):
+    """
+    Starts one processing job per uploaded file, all with the same options.
+
+    Like /start-processing, but for many files in one request: every job
+    record is inserted in a single transaction, and the jobs are dispatched
+    as one Celery group. The user's jobs then run at most
+    MAX_CONCURRENT_JOBS_PER_USER at a time; the rest stay PENDING until a slot frees up.
+    """
+    if not object_names:
+        raise HTTPException(status_code=400, detail="No files given")
+    if len(object_names) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} files per batch")
+
+    # One "job ticket" per file, in the table matching its type.
+    records = []
+    for object_name in object_names:
+        Model = Video if object_name.lower().endswith((".mp4", ".mov", ".mkv")) else Audio
+        records.append(Model(
+            user_id=user.id,
+            file_path=object_name,
+            object_name=object_name,
+            status="PENDING",
+        ))
+    db.add_all(records)
+    # The flush assigns the ids; reading them before the commit saves a refresh per record.
+    db.flush()
+    jobs = [{
+        "job_id": record.id,
+        "object_name": record.object_name,
+        "options": options,
+        "user_id": user.id,
+        "is_video": isinstance(record, Video),
+    } for record in records]
+    db.commit()
+
+    print(f"Created {len(jobs)} job records for user {user.id}. Dispatching them as one group...")
+    start_processing_batch(jobs)
+
+    return {
+        "message": f"Processing of {len(jobs)} files has been successfully started.",
+        "jobs": [{"job_id": job["job_id"], "object_name": job["object_name"],
+                  "media_type": "video" if job["is_video"] else "audio"} for job in jobs]
+    }
+
+
 @router.get("/jobs/{job_id}/status")
 def get_job_status(
     job_id: int,
@@ -106,11 +171,106 @@ def get_job_status(
     if not record:
         raise HTTPException(status_code=404, detail="Job not found or you do not have permission to view it.")
 
-    # 4. Return the relevant information from the database record.
+    # 4. Return the relevant information from the database record, plus the
+    # live stage/percent/ETA the worker keeps in Redis (None when unknown).
     # The frontend can use this data to update the UI.
     return {
         "job_id": record.id,
         "status": record.status,
         "public_url": record.public_url,
-        "error": record.error_message
+        "error": record.error_message,
+        "progress": get_job_progress(media_type, job_id)
+    }
+
+
+def _job_status_event(status: dict) -> str:
+    return f"event: status\ndata: {json.dumps(status)}\n\n"
+
+
+@router.post("/jobs/{job_id}/events-token")
+def create_job_events_token(
+    job_id: int,
+    media_type: str = Query(..., description="Specify 'audio' or 'video' to search the correct table.", enum=["video", "audio"]),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """
+    Issues the short-lived token /jobs/{job_id}/events is opened with. The
+    browser's EventSource can't send an Authorization header, so the stream
+    takes this token as a query parameter instead of the user's access token.
+    """
+    Model = Video if media_type == "video" else Audio
+    if not db.query(Model.id).filter(Model.id == job_id, Model.user_id == user.id).first():
+        raise HTTPException(status_code=404, detail="Job not found or you do not have permission to view it.")
+    return {
+        "token": create_stream_token(user, f"{media_type}:{job_id}"),
+        "expires_in": STREAM_TOKEN_EXPIRE_SECONDS
+    }
+
+
+@router.get("/jobs/{job_id}/events")
+def stream_job_events(
+    job_id: int,
+    media_type: str = Query(..., description="Specify 'audio' or 'video' to search the correct table.", enum=["video", "audio"]),
+    token: str = Query(..., description="Token from POST /jobs/{job_id}/events-token."),
+    db: Session = Depends(get_db)
+):
+    """
+    Push alternative to polling /jobs/{job_id}/status, as Server-Sent Events:
+
+        const { token } = await post(`/jobs/${id}/events-token?media_type=video`);
+        new EventSource(`/jobs/${id}/events?media_type=video&token=${token}`);
+
+    The token and job are checked once, when the stream opens. After that the
+    stream only listens on the job's Redis channel, which the worker publishes
+    every status transition and progress update on. Each "status" event has the
+    same shape as the /status response. The stream ends once the job is
+    COMPLETED or FAILED.
+    """
+    user_id = verify_stream_token(token, f"{media_type}:{job_id}")
+    Model = Video if media_type == "video" else Audio
+    record = db.query(Model).filter(Model.id == job_id, Model.user_id == user_id).first()
+    if not record:
+        raise HTTPException(status_code=404, detail="Job not found or you do not have permission to view it.")
+    current = {
+        "job_id": record.id,
+        "status": record.status,
+        "public_url": record.public_url,
+        "error": record.error_message,
+        "progress": None
     }
+    # The stream can stay open for the whole job; don't hold a database connection that long.
+    db.close()
+
+    async def events():
+        pubsub = get_async_redis().pubsub()
+        # Subscribed before the snapshot is read, so no transition falls in between.
+        await pubsub.subscribe(progress_channel(media_type, job_id))
+        try:
+            state = await get_job_progress_async(media_type, job_id)
+            while True:
+                if state is not None:
+                    current["progress"] = state
+                    for field in ("status", "public_url", "error"):
+                        if state.get(field) is not None:
+                            current[field] = state[field]
+                yield _job_status_event(current)
+                if current["status"] in FINAL_JOB_STATUSES:
+                    return
+
+                message = None
+                while message is None:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                       timeout=JOB_EVENTS_KEEPALIVE_SECONDS)
+                    if message is None:
+                        yield ": keep-alive\n\n"
+                state = json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Stops nginx-style proxies from buffering the stream.
+        "X-Accel-Buffering": "no",
+    })
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.transcription.result import Transcript
+
+load_dotenv()
+
+TRANSCRIPT_CACHE_DIR = Path(os.getenv("TRANSCRIPT_CACHE_DIR", "/tmp/shushu_transcripts"))
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "512"))
+# Mirror entries to Spaces so every worker host shares one cache.
+TRANSCRIPT_CACHE_SPACES = os.getenv("TRANSCRIPT_CACHE_SPACES", "false").lower() == "true"
+TRANSCRIPT_CACHE_SPACES_PREFIX = "cache/transcripts/"
+
+
+def transcript_cache_key(audio: np.ndarray, **params) -> str:
+    """
+    Content address for a transcription: the decoded PCM samples plus every
+    setting that changes Whisper's output (model size, compute type, prompt,
+    decoding parameters).
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(audio, dtype=np.float32))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return TRANSCRIPT_CACHE_DIR / f"{key}.npz"
+
+
+def _read_entry(path: Path) -> Transcript | None:
+    try:
+        return Transcript.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_entry(path: Path, transcript: Transcript):
+    """Writes through a temp file so readers never see a partial entry."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            transcript.save(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _evict_to_budget():
+    """Deletes least-recently-used entries (by mtime) until under the size budget."""
+    budget = TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    for path in TRANSCRIPT_CACHE_DIR.glob("*.npz"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget:
+            break
+        try:
+            path.unlink()
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+def _fetch_from_spaces(key: str, path: Path) -> bool:
+    from botocore.exceptions import ClientError
+    from src.space.service import s3_client, DO_SPACES_BUCKET_NAME
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".download")
+    try:
+        s3_client.download_file(DO_SPACES_BUCKET_NAME, f"{TRANSCRIPT_CACHE_SPACES_PREFIX}{key}.npz", str(tmp_path))
+        os.replace(tmp_path, path)
+        return True
+    except ClientError:
+        return False
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _push_to_spaces(key: str, path: Path):
+    from src.space.service import s3_client, DO_SPACES_BUCKET_NAME
+
+    s3_client.upload_file(str(path), DO_SPACES_BUCKET_NAME, f"{TRANSCRIPT_CACHE_SPACES_PREFIX}{key}.npz")
+
+
+def get_cached_transcript(key: str) -> Transcript | None:
+    """Returns the cached transcription for `key`, or None on a miss."""
+    path = _entry_path(key)
+    transcript = _read_entry(path) if path.exists() else None
+
+    if transcript is None and TRANSCRIPT_CACHE_SPACES:
+        try:
+            if _fetch_from_spaces(key, path):
+                transcript = _read_entry(path)
+        except Exception as e:
+            print(f"⚠️ Transcript cache lookup in Spaces failed: {e}")
+
+    if transcript is not None:
+        # Touch the entry so eviction treats it as recently used.
+        os.utime(path, None)
+        print(f"Transcript cache hit: {key[:12]}")
+    return transcript
+
+
+def store_transcript(key: str, transcript: Transcript):
+    """Saves a transcription under `key`. Failures are logged, never raised."""
+    path = _entry_path(key)
+    try:
+        _write_entry(path, transcript)
+        _evict_to_budget()
+        if TRANSCRIPT_CACHE_SPACES:
+            _push_to_spaces(key, path)
+    except Exception as e:
+        print(f"⚠️ Could not store transcript in cache: {e}")
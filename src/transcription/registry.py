@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from faster_whisper import WhisperModel
+
+load_dotenv()
+
+# How many Whisper models a single worker process may keep resident at once.
+# "base" + "medium" is what the filler pipeline needs, so 2 is the default.
+WHISPER_MAX_MODELS = int(os.getenv("WHISPER_MAX_MODELS", "2"))
+# Optional memory budget (in MB) for all resident models. 0 disables the check.
+WHISPER_MODEL_MEMORY_MB = int(os.getenv("WHISPER_MODEL_MEMORY_MB", "0"))
+
+# Approximate parameter counts, used when RSS can't be measured.
+_MODEL_PARAMS = {
+    "tiny": 39_000_000,
+    "base": 74_000_000,
+    "small": 244_000_000,
+    "medium": 769_000_000,
+    "large-v1": 1_550_000_000,
+    "large-v2": 1_550_000_000,
+    "large-v3": 1_550_000_000,
+    "turbo": 809_000_000,
+}
+_BYTES_PER_PARAM = {
+    "float32": 4,
+    "float16": 2,
+    "bfloat16": 2,
+    "int8_float32": 1,
+    "int8_float16": 1,
+    "int8_bfloat16": 1,
+    "int8": 1,
+}
+
+def _available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Concurrent transcribe() calls one model serves: chunked decoding of long audio
+# runs this many chunks at once (default: half the cores). Every model is loaded
+# this way, so the models warmed at worker start serve long media too.
+WHISPER_NUM_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "0")) or max(1, _available_cores() // 2)
+WHISPER_CPU_THREADS = max(1, _available_cores() // WHISPER_NUM_WORKERS)
+
+_models = OrderedDict()  # key -> {"model", "bytes", "loaded_at", "hits"}
+_lock = threading.RLock()
+
+
+def _current_rss_bytes() -> int | None:
+    """Resident set size of this process, read from /proc (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _estimate_model_bytes(model_size: str, compute_type: str) -> int:
+    params = _MODEL_PARAMS.get(model_size.removesuffix(".en"), _MODEL_PARAMS["medium"])
+    return params * _BYTES_PER_PARAM.get(compute_type, 4)
+
+
+def _evict_until_within_budget(incoming_bytes: int = 0):
+    """Drops least-recently-used models until the count and memory caps hold."""
+    budget = WHISPER_MODEL_MEMORY_MB * 1024 * 1024
+    while _models:
+        resident = sum(entry["bytes"] for entry in _models.values())
+        over_count = len(_models) >= WHISPER_MAX_MODELS
+        over_memory = budget and resident + incoming_bytes > budget
+        if not (over_count or over_memory):
+            break
+        key, entry = _models.popitem(last=False)
+        print(f"Evicting Whisper model {key} ({entry['bytes'] // (1024 * 1024)} MB) from registry.")
+
+
+def get_whisper_model(
+    model_size: str,
+    compute_type: str = "float32",
+    device: str = "cpu",
+) -> WhisperModel:
+    """
+    Returns a process-wide WhisperModel for (model_size, compute_type, device),
+    loading it on first use. Models are kept in LRU order and evicted once
+    WHISPER_MAX_MODELS or WHISPER_MODEL_MEMORY_MB would be exceeded.
+
+    Every model is built with WHISPER_NUM_WORKERS workers, so single-stream and
+    chunked decoding share one instance per key.
+    """
+    key = (model_size, compute_type, device)
+
+    with _lock:
+        entry = _models.get(key)
+        if entry is not None:
+            _models.move_to_end(key)
+            entry["hits"] += 1
+            return entry["model"]
+
+        _evict_until_within_budget(_estimate_model_bytes(model_size, compute_type))
+
+        print(f"Loading Whisper model {key} into registry...")
+        started = time.monotonic()
+        rss_before = _current_rss_bytes()
+        model = WhisperModel(
+            model_size,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=WHISPER_CPU_THREADS,
+            num_workers=WHISPER_NUM_WORKERS,
+        )
+        rss_after = _current_rss_bytes()
+
+        if rss_before is not None and rss_after is not None and rss_after > rss_before:
+            model_bytes = rss_after - rss_before
+        else:
+            model_bytes = _estimate_model_bytes(model_size, compute_type)
+
+        _models[key] = {
+            "model": model,
+            "bytes": model_bytes,
+            "loaded_at": time.time(),
+            "hits": 0,
+        }
+        print(f"✅ Whisper model {key} loaded in {time.monotonic() - started:.1f}s "
+              f"(~{model_bytes // (1024 * 1024)} MB).")
+        return model
+
+
+def registry_stats() -> dict:
+    """Snapshot of the resident models and their accounted memory."""
+    with _lock:
+        models = [
+            {
+                "model_size": key[0],
+                "compute_type": key[1],
+                "device": key[2],
+                "bytes": entry["bytes"],
+                "hits": entry["hits"],
+                "loaded_at": entry["loaded_at"],
+            }
+            for key, entry in _models.items()
+        ]
+    return {
+        "models": models,
+        "resident_bytes": sum(m["bytes"] for m in models),
+        "max_models": WHISPER_MAX_MODELS,
+        "num_workers": WHISPER_NUM_WORKERS,
+        "cpu_threads": WHISPER_CPU_THREADS,
+        "memory_budget_bytes": WHISPER_MODEL_MEMORY_MB * 1024 * 1024,
+    }
+
+
+def clear_registry():
+    """Drops every resident model (e.g. before a worker forks or shuts down)."""
+    with _lock:
+        _models.clear()
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class Transcript:
+    """
+    Word- and sentence-level transcription from a single Whisper decode, kept
+    as parallel arrays rather than lists of dicts.
+
+    Words are stored as ids into `vocabulary` (distinct raw word strings, with
+    Whisper's leading spaces) alongside their start/end times. Segment i spans
+    words[segment_offsets[i]:segment_offsets[i + 1]] and has its own start/end,
+    so sentences are rebuilt from the same word columns.
+    """
+
+    __slots__ = (
+        "vocabulary", "word_ids", "word_starts", "word_ends",
+        "segment_offsets", "segment_starts", "segment_ends",
+        "language", "language_probability",
+    )
+
+    def __init__(
+        self,
+        vocabulary: list[str],
+        word_ids: np.ndarray,
+        word_starts: np.ndarray,
+        word_ends: np.ndarray,
+        segment_offsets: np.ndarray,
+        segment_starts: np.ndarray,
+        segment_ends: np.ndarray,
+        language: str,
+        language_probability: float,
+    ):
+        self.vocabulary = vocabulary
+        self.word_ids = word_ids
+        self.word_starts = word_starts
+        self.word_ends = word_ends
+        self.segment_offsets = segment_offsets
+        self.segment_starts = segment_starts
+        self.segment_ends = segment_ends
+        self.language = language
+        self.language_probability = language_probability
+
+    @classmethod
+    def from_segments(cls, segments, info) -> "Transcript":
+        vocabulary, lookup = [], {}
+        word_ids, word_starts, word_ends = [], [], []
+        segment_offsets, segment_starts, segment_ends = [0], [], []
+
+        for segment in segments:
+            for word in segment.words or []:
+                word_id = lookup.get(word.word)
+                if word_id is None:
+                    word_id = lookup[word.word] = len(vocabulary)
+                    vocabulary.append(word.word)
+                word_ids.append(word_id)
+                word_starts.append(word.start)
+                word_ends.append(word.end)
+            segment_offsets.append(len(word_ids))
+            segment_starts.append(segment.start)
+            segment_ends.append(segment.end)
+
+        return cls(
+            vocabulary=vocabulary,
+            word_ids=np.array(word_ids, dtype=np.int32),
+            word_starts=np.array(word_starts, dtype=np.float64),
+            word_ends=np.array(word_ends, dtype=np.float64),
+            segment_offsets=np.array(segment_offsets, dtype=np.int32),
+            segment_starts=np.array(segment_starts, dtype=np.float64),
+            segment_ends=np.array(segment_ends, dtype=np.float64),
+            language=info.language,
+            language_probability=float(info.language_probability),
+        )
+
+    def __len__(self) -> int:
+        return len(self.word_ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.word_ids, self.word_starts, self.word_ends,
+                  self.segment_offsets, self.segment_starts, self.segment_ends)
+        return sum(a.nbytes for a in arrays) + sum(len(w) for w in self.vocabulary)
+
+    def words(self) -> list[dict]:
+        """Word view: [{'word', 'start', 'end'}, ...] as used by filler detection."""
+        stripped = [w.strip() for w in self.vocabulary]
+        return [
+            {"word": stripped[word_id], "start": round(start, 4), "end": round(end, 4)}
+            for word_id, start, end in zip(
+                self.word_ids.tolist(), self.word_starts.tolist(), self.word_ends.tolist()
+            )
+        ]
+
+    def sentences(self) -> list[dict]:
+        """Sentence view: [{'start', 'end', 'text'}, ...] as used by shorts analysis."""
+        word_ids = self.word_ids.tolist()
+        offsets = self.segment_offsets.tolist()
+        sentences = []
+        for i, (start, end) in enumerate(zip(self.segment_starts.tolist(), self.segment_ends.tolist())):
+            text = "".join(self.vocabulary[word_id] for word_id in word_ids[offsets[i]:offsets[i + 1]]).strip()
+            if text:
+                sentences.append({"start": round(start, 2), "end": round(end, 2), "text": text})
+        return sentences
+
+    def save(self, file):
+        np.savez_compressed(
+            file,
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            word_ids=self.word_ids,
+            word_starts=self.word_starts,
+            word_ends=self.word_ends,
+            segment_offsets=self.segment_offsets,
+            segment_starts=self.segment_starts,
+            segment_ends=self.segment_ends,
+            language=np.array(self.language or ""),
+            language_probability=np.array(self.language_probability),
+        )
+
+    @classmethod
+    def load(cls, file) -> "Transcript":
+        with np.load(file, allow_pickle=False) as data:
+            return cls(
+                vocabulary=data["vocabulary"].tolist(),
+                word_ids=data["word_ids"],
+                word_starts=data["word_starts"],
+                word_ends=data["word_ends"],
+                segment_offsets=data["segment_offsets"],
+                segment_starts=data["segment_starts"],
+                segment_ends=data["segment_ends"],
+                language=str(data["language"]),
+                language_probability=float(data["language_probability"]),
+            )
@@ -0,0 +1,188 @@
+import dataclasses
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from faster_whisper import decode_audio
+
+from src.progress import report_progress
+from src.transcription.cache import transcript_cache_key, get_cached_transcript, store_transcript
+from src.transcription.registry import get_whisper_model, WHISPER_NUM_WORKERS
+from src.transcription.result import Transcript
+
+load_dotenv()
+
+SAMPLE_RATE = 16000
+
+# One verbatim prompt for every consumer, so filler removal, shorts analysis
+# and summaries of the same audio share a single decode.
+VERBATIM_PROMPT = ("Transcribe everything exactly as spoken,"
+                   "including ums and uhs, and absolutely all filler words")
+
+# Audio at least this long is split at silences and decoded in parallel.
+CHUNKED_MIN_SECONDS = float(os.getenv("TRANSCRIBE_CHUNKED_MIN_SECONDS", "600"))
+# Preferred chunk length; actual boundaries move to the quietest nearby point.
+CHUNK_TARGET_SECONDS = float(os.getenv("TRANSCRIBE_CHUNK_SECONDS", "120"))
+CHUNK_SEARCH_SECONDS = 10.0
+
+
+def load_audio(file_path: Path | str) -> np.ndarray:
+    """Decodes any audio/video file to 16 kHz mono float32 samples."""
+    return decode_audio(str(file_path), sampling_rate=SAMPLE_RATE)
+
+
+def find_silence_boundaries(
+    audio: np.ndarray,
+    target_seconds: float = CHUNK_TARGET_SECONDS,
+    search_seconds: float = CHUNK_SEARCH_SECONDS,
+    frame_seconds: float = 0.03,
+) -> list[int]:
+    """
+    Picks chunk boundaries (sample offsets, including 0 and len(audio)) roughly
+    every `target_seconds`, each moved to the quietest frame within
+    ±`search_seconds` so that cuts land in pauses rather than mid-word.
+    """
+    frame = int(frame_seconds * SAMPLE_RATE)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [0, len(audio)]
+
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    # Smooth over ~300ms so a single quiet frame inside a word doesn't win.
+    kernel = np.ones(10) / 10
+    energy = np.convolve(energy, kernel, mode="same")
+
+    target = int(target_seconds / frame_seconds)
+    search = int(search_seconds / frame_seconds)
+
+    boundaries = [0]
+    position = target
+    while position < n_frames - search:
+        lo, hi = position - search, position + search
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        boundaries.append(quietest * frame + frame // 2)
+        position = quietest + target
+    boundaries.append(len(audio))
+    return boundaries
+
+
+def _offset_segment(segment, offset: float, segment_id: int):
+    words = None
+    if segment.words:
+        words = [
+            dataclasses.replace(word, start=word.start + offset, end=word.end + offset)
+            for word in segment.words
+        ]
+    return dataclasses.replace(
+        segment,
+        id=segment_id,
+        start=segment.start + offset,
+        end=segment.end + offset,
+        words=words,
+    )
+
+
+def transcribe_segments(
+    audio: Path | str | np.ndarray,
+    model_size: str,
+    compute_type: str = "float32",
+    chunked: bool | None = None,
+    **transcribe_kwargs,
+) -> tuple[list, object]:
+    """
+    Runs faster-whisper over a file (or already-decoded 16 kHz samples) and
+    returns (segments, info) with absolute timestamps.
+
+    Long audio (>= TRANSCRIBE_CHUNKED_MIN_SECONDS, or chunked=True) is split at
+    silence boundaries and the chunks are decoded concurrently on a model
+    built with one worker per chunk slot; word and segment timestamps are
+    shifted back by each chunk's offset. Windowed decodes (clip_timestamps)
+    always run as a single pass.
+    """
+    if not isinstance(audio, np.ndarray):
+        audio = load_audio(audio)
+    duration = len(audio) / SAMPLE_RATE
+
+    if transcribe_kwargs.get("clip_timestamps", "0") != "0":
+        chunked = False
+    elif chunked is None:
+        chunked = duration >= CHUNKED_MIN_SECONDS
+
+    boundaries = find_silence_boundaries(audio) if chunked else [0, len(audio)]
+    if len(boundaries) <= 2:
+        model = get_whisper_model(model_size, compute_type=compute_type)
+        segments, info = model.transcribe(audio, **transcribe_kwargs)
+        decoded = []
+        # Segments are decoded lazily; each one's end time is how far decoding got.
+        for segment in segments:
+            decoded.append(segment)
+            report_progress(segment.end, duration)
+        return decoded, info
+
+    # The registry's models serve WHISPER_NUM_WORKERS decodes at once.
+    workers = min(len(boundaries) - 1, WHISPER_NUM_WORKERS)
+    model = get_whisper_model(model_size, compute_type=compute_type)
+    print(f"Transcribing {duration:.0f}s of audio in {len(boundaries) - 1} chunks "
+          f"with {workers} parallel workers...")
+
+    def _transcribe_chunk(bounds):
+        start, end = bounds
+        segments, info = model.transcribe(audio[start:end], **transcribe_kwargs)
+        # Consume the generator inside the worker thread so decoding runs here.
+        return list(segments), info
+
+    chunks = list(zip(boundaries[:-1], boundaries[1:]))
+    results = []
+    decoded_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (start, end), result in zip(chunks, pool.map(_transcribe_chunk, chunks)):
+            decoded_seconds += (end - start) / SAMPLE_RATE
+            report_progress(decoded_seconds, duration)
+            results.append(result)
+
+    stitched = []
+    for (start, _), (segments, _) in zip(chunks, results):
+        offset = start / SAMPLE_RATE
+        for segment in segments:
+            stitched.append(_offset_segment(segment, offset, len(stitched) + 1))
+
+    # Language detection from the first chunk, duration from the whole file.
+    info = dataclasses.replace(results[0][1], duration=duration, duration_after_vad=duration)
+    return stitched, info
+
+
+def transcribe(
+    file_path: Path | str,
+    model_size: str,
+    compute_type: str = "float32",
+    clip_timestamps: list[float] | None = None,
+) -> Transcript:
+    """
+    Single-decode transcription with both word and sentence granularity.
+    Results are cached by audio content, so every caller asking for the same
+    audio and model reuses one decode.
+
+    `clip_timestamps` ([start, end, start, end, ...] in seconds) restricts
+    decoding to those windows; timestamps stay absolute.
+    """
+    audio = load_audio(file_path)
+    decode_options = dict(
+        initial_prompt=VERBATIM_PROMPT,
+        vad_filter=False,
+        suppress_tokens=[],
+        beam_size=5,
+        word_timestamps=True,
+        condition_on_previous_text=False,
+        clip_timestamps=clip_timestamps or "0",
+    )
+    cache_key = transcript_cache_key(audio, model_size=model_size, compute_type=compute_type, **decode_options)
+    transcript = get_cached_transcript(cache_key)
+    if transcript is not None:
+        return transcript
+
+    segments, info = transcribe_segments(audio, model_size, compute_type=compute_type, **decode_options)
+    transcript = Transcript.from_segments(segments, info)
+    store_transcript(cache_key, transcript)
+    return transcript
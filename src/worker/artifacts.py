@@ -0,0 +1,100 @@
+import os
+import shutil
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "local" keeps job files on this machine's disk (every stage must run on the
+# same host); "spaces" keeps them in the Spaces bucket so any worker can run any stage.
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "local")
+ARTIFACT_LOCAL_ROOT = os.getenv("ARTIFACT_LOCAL_ROOT", "/tmp/shushu_artifacts")
+ARTIFACT_SPACES_PREFIX = "artifacts/jobs"
+
+
+class ArtifactStore:
+    """
+    Files a job's stages hand to each other, addressed by (job_id, name).
+    A stored file is only ever visible complete.
+    """
+
+    # Whether fetched paths are shared with the stage that stored them
+    # (i.e. all stages run against the same disk).
+    is_local = False
+
+    def put_file(self, job_id: int, name: str, local_path: str) -> str:
+        """Stores `local_path` as the job's `name`, returning a reference for logs."""
+        raise NotImplementedError
+
+    def fetch(self, job_id: int, name: str, work_dir: str) -> str:
+        """Returns a local path to the job's `name`, downloading it into `work_dir` if needed."""
+        raise NotImplementedError
+
+    def delete_job(self, job_id: int):
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    is_local = True
+
+    def __init__(self, root: str = ARTIFACT_LOCAL_ROOT):
+        self.root = Path(root)
+
+    def _path(self, job_id: int, name: str) -> Path:
+        return self.root / str(job_id) / name
+
+    def put_file(self, job_id: int, name: str, local_path: str) -> str:
+        path = self._path(job_id, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{name}.{os.getpid()}")
+        # Moving within one filesystem is free; across filesystems it's a copy.
+        shutil.move(local_path, tmp_path)
+        os.replace(tmp_path, path)
+        return str(path)
+
+    def fetch(self, job_id: int, name: str, work_dir: str) -> str:
+        path = self._path(job_id, name)
+        if not path.exists():
+            raise FileNotFoundError(f"Artifact '{name}' of job {job_id} not found in {self.root}.")
+        return str(path)
+
+    def delete_job(self, job_id: int):
+        shutil.rmtree(self.root / str(job_id), ignore_errors=True)
+
+
+class SpacesArtifactStore(ArtifactStore):
+    def __init__(self, prefix: str = ARTIFACT_SPACES_PREFIX):
+        # Only this backend needs the Spaces client (and its credentials).
+        from src.space.service import s3_client, DO_SPACES_BUCKET_NAME
+
+        self.s3_client = s3_client
+        self.bucket = DO_SPACES_BUCKET_NAME
+        self.prefix = prefix
+
+    def _key(self, job_id: int, name: str) -> str:
+        return f"{self.prefix}/{job_id}/{name}"
+
+    def put_file(self, job_id: int, name: str, local_path: str) -> str:
+        # S3 PUTs are atomic: readers see the old object or the whole new one.
+        self.s3_client.upload_file(local_path, self.bucket, self._key(job_id, name))
+        return self._key(job_id, name)
+
+    def fetch(self, job_id: int, name: str, work_dir: str) -> str:
+        local_path = os.path.join(work_dir, name)
+        self.s3_client.download_file(self.bucket, self._key(job_id, name), local_path)
+        return local_path
+
+    def delete_job(self, job_id: int):
+        listing = self.s3_client.list_objects_v2(Bucket=self.bucket, Prefix=f"{self.prefix}/{job_id}/")
+        objects = [{"Key": item["Key"]} for item in listing.get("Contents", [])]
+        if objects:
+            self.s3_client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+
+def get_artifact_store(backend: str = ARTIFACT_STORE) -> ArtifactStore:
+    if backend == "local":
+        return LocalArtifactStore()
+    if backend == "spaces":
+        return SpacesArtifactStore()
+    raise ValueError(f"Unknown artifact store '{backend}'. Choose 'local' or 'spaces'.")
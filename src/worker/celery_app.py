@@ -1,5 +1,9 @@
 import os
+import importlib
+import time
+
 from celery import Celery
+from celery.signals import worker_init, worker_process_init, worker_ready, worker_shutdown
 from dotenv import load_dotenv
 from celery.schedules import crontab
 
@@ -21,8 +25,124 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # Warm-up runs inside the child's init, before it reports itself as up.
+    # Model loads take far longer than Celery's default 4s allowance.
+    worker_proc_alive_timeout=int(os.getenv("WORKER_PROC_ALIVE_TIMEOUT", "300")),
+    # A worker only reserves the task it is about to run, so a job never sits
+    # in the prefetch buffer of a worker busy with an hour-long render.
+    worker_prefetch_multiplier=1,
+    # Late-acked tasks are redelivered if unacknowledged this long, so it must
+    # outlast the longest task or a running render would be started twice.
+    broker_transport_options={"visibility_timeout": 2 * 3600},
+)
+
+# Queues by resource profile. Each is consumed by its own worker service with
+# a pool type and concurrency to match (see docker-compose.yml):
+#   transcription  Whisper: CPU and memory heavy     prefork, low concurrency
+#   render         FFmpeg encodes: CPU heavy         prefork, 1 job at a time
+#   io             Pexels, Cleanvoice, Spaces        threads, high concurrency
+#   db             light bookkeeping (the default)   threads
+TASK_ROUTES = {
+    "src.worker.tasks.start_shorts_analysis_task": {"queue": "transcription"},
+    "src.worker.tasks.process_audio_task": {"queue": "transcription"},
+    "src.worker.tasks.download_broll_task": {"queue": "io"},
+    "src.worker.tasks.assemble_video_task": {"queue": "render"},
+    "src.worker.tasks.process_video_task": {"queue": "render"},
+}
+celery_app.conf.update(
+    task_routes=TASK_ROUTES,
+    task_default_queue="db",
 )
 
+# Whisper models each queue's workers should have resident before taking jobs.
+# A worker consuming several queues preloads the union of their profiles.
+WARMUP_PROFILES = {
+    "transcription": ["base", "medium"],
+    "render": ["base", "medium"],
+    "io": [],
+    "db": [],
+}
+# Modules whose import creates the shared API clients (AzureOpenAI, boto3).
+WARMUP_CLIENT_MODULES = [
+    "src.shorts.ai.service",
+    "src.space.service",
+]
+
+# Set these alongside the worker's `-Q` and `--pool` flags, e.g. WORKER_QUEUES=render
+WORKER_QUEUES = [q.strip() for q in os.getenv("WORKER_QUEUES", "db").split(",") if q.strip()]
+WORKER_POOL = os.getenv("WORKER_POOL", "prefork")
+WORKER_WARMUP_ENABLED = os.getenv("WORKER_WARMUP_ENABLED", "true").lower() == "true"
+# Touched once a pool process is warm; used as the container readiness probe.
+WORKER_READY_FILE = os.getenv("WORKER_READY_FILE", "/tmp/shushu_worker_ready")
+
+
+def get_warmup_models(queues: list) -> list:
+    models = []
+    for queue in queues:
+        for model_size in WARMUP_PROFILES.get(queue, []):
+            if model_size not in models:
+                models.append(model_size)
+    return models
+
+
+def _clear_ready_file():
+    try:
+        os.remove(WORKER_READY_FILE)
+    except FileNotFoundError:
+        pass
+
+
+@worker_init.connect
+def reset_readiness(**kwargs):
+    # A marker left behind by a previous run must not report this one as ready.
+    _clear_ready_file()
+
+
+def _warm_up():
+    started = time.monotonic()
+
+    for module_name in WARMUP_CLIENT_MODULES:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            print(f"⚠️ Warm-up could not initialise clients from {module_name}: {e}")
+
+    from src.transcription.registry import get_whisper_model
+
+    for model_size in get_warmup_models(WORKER_QUEUES):
+        try:
+            get_whisper_model(model_size)
+        except Exception as e:
+            print(f"⚠️ Warm-up could not load Whisper model '{model_size}': {e}")
+
+    with open(WORKER_READY_FILE, "w") as f:
+        f.write(str(time.time()))
+    print(f"✅ Worker process {os.getpid()} warm in {time.monotonic() - started:.1f}s "
+          f"(queues: {', '.join(WORKER_QUEUES)}).")
+
+
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    """
+    Preloads Whisper models and API clients in each pool process. The prefork
+    pool only hands jobs to a child after this returns, so no task pays the
+    cold-start cost.
+    """
+    if WORKER_WARMUP_ENABLED:
+        _warm_up()
+
+
+@worker_ready.connect
+def warm_up_worker(**kwargs):
+    """Thread pools have no child processes; their single process warms up here instead."""
+    if WORKER_WARMUP_ENABLED and WORKER_POOL != "prefork":
+        _warm_up()
+
+
+@worker_shutdown.connect
+def clear_readiness(**kwargs):
+    _clear_ready_file()
+
 # celery_app.conf.beat_schedule = {
 #     # Give the schedule a name
 #     'delete-old-files-every-hour': {
@@ -0,0 +1,77 @@
+import datetime
+import os
+from pathlib import Path
+
+from src.worker.artifacts import ArtifactStore
+
+
+class JobCheckpoints:
+    """
+    Completed stages of one job, recorded on its record's `checkpoints`
+    column as {stage: {"artifact": name or None, "data": {...}, "at": iso time}}.
+    Stage outputs are kept in the artifact store, so a retry on any worker
+    sharing the store can pick up where the last attempt stopped.
+
+        if checkpoints.done("extract"):
+            audio_path = checkpoints.artifact("extract")
+        else:
+            audio_path = checkpoints.save("extract", extract(...))
+    """
+
+    def __init__(self, db, record, store: ArtifactStore, work_dir: str):
+        self.db = db
+        self.record = record
+        self.store = store
+        self.work_dir = work_dir
+        # Local paths of artifacts already in hand this attempt, by artifact name.
+        self._paths = {}
+
+    @property
+    def stages(self) -> dict:
+        return self.record.checkpoints or {}
+
+    def done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def data(self, stage: str) -> dict:
+        return self.stages.get(stage, {}).get("data", {})
+
+    def artifact(self, stage: str) -> str | None:
+        """Local path of a completed stage's artifact, fetched from the store if needed."""
+        name = self.stages[stage].get("artifact")
+        if name is None:
+            return None
+        if name not in self._paths:
+            self._paths[name] = self.store.fetch(self.record.id, name, self.work_dir)
+        return self._paths[name]
+
+    def save(self, stage: str, artifact_path: str = None, **data) -> str | None:
+        """
+        Stores the stage's output file (if any) and records the stage as done.
+        Returns the path to keep working with, which may have moved into the store.
+        """
+        name = None
+        if artifact_path is not None:
+            name = next((n for n, p in self._paths.items() if p == str(artifact_path)), None)
+            if name is None:
+                # Already-stored outputs (e.g. a stage that changed nothing) aren't stored twice.
+                name = f"{stage}{Path(artifact_path).suffix}"
+                self.store.put_file(self.record.id, name, str(artifact_path))
+                self._paths[name] = str(artifact_path) if os.path.exists(artifact_path) \
+                    else self.store.fetch(self.record.id, name, self.work_dir)
+
+        # A new dict, so SQLAlchemy sees the JSON column change.
+        self.record.checkpoints = {**self.stages, stage: {
+            "artifact": name,
+            "data": data,
+            "at": datetime.datetime.utcnow().isoformat(),
+        }}
+        self.db.commit()
+        print(f"💾 Job {self.record.id}: checkpoint '{stage}' saved.")
+        return self._paths.get(name)
+
+    def clear(self):
+        """Forgets all checkpoints and deletes their artifacts."""
+        self.store.delete_job(self.record.id)
+        self.record.checkpoints = None
+        self.db.commit()
@@ -0,0 +1,70 @@
+import os
+import time
+
+import redis
+from dotenv import load_dotenv
+
+from src.cache import get_redis
+
+load_dotenv()
+
+# Jobs of one user that may run at the same time; the rest wait their turn.
+MAX_CONCURRENT_JOBS_PER_USER = int(os.getenv("MAX_CONCURRENT_JOBS_PER_USER", "3"))
+# A slot whose job never released it (worker killed) frees itself after this long.
+# Matches the broker's visibility_timeout, after which such a job is redelivered anyway.
+# Callers whose tasks have a shorter time limit pass a shorter ttl to acquire().
+USER_JOB_SLOT_TTL = 7200
+
+# KEYS[1] = the user's slot set; ARGV = job, now, expiry, limit, set ttl.
+# Expired slots are dropped first; a job already holding a slot (a retry or
+# a redelivery of it) keeps it.
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+class UserJobSlots:
+    """
+    Per-user counting semaphore in Redis: a sorted set of the jobs holding
+    a slot ("audio:5", "video:5"; ids are per table), scored by when each
+    slot expires. Shared by all workers, so the limit holds however the
+    user's jobs are spread over queues and machines.
+    """
+
+    def __init__(self, limit: int = MAX_CONCURRENT_JOBS_PER_USER, ttl: int = USER_JOB_SLOT_TTL):
+        self.limit = limit
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"jobslots:{user_id}"
+
+    @staticmethod
+    def _member(kind: str, job_id: int) -> str:
+        return f"{kind}:{job_id}"
+
+    def acquire(self, user_id: int, kind: str, job_id: int, ttl: int = None) -> bool:
+        """
+        Takes a slot for the job; False if the user's slots are all taken.
+        The slot frees itself after `ttl` seconds (default: the instance's) if never released.
+        """
+        now = time.time()
+        try:
+            return bool(get_redis().eval(_ACQUIRE_SCRIPT, 1, self._key(user_id), self._member(kind, job_id),
+                                         now, now + (ttl or self.ttl), self.limit, max(ttl or 0, self.ttl)))
+        except redis.RedisError as e:
+            # Better to run over the limit than to stall every job.
+            print(f"⚠️ Could not check the job limit of user {user_id}: {e}")
+            return True
+
+    def release(self, user_id: int, kind: str, job_id: int):
+        try:
+            get_redis().zrem(self._key(user_id), self._member(kind, job_id))
+        except redis.RedisError as e:
+            print(f"⚠️ Could not release the job slot of {kind} job {job_id}: {e}")
@@ -3,21 +3,31 @@ import os
 import time
 from pathlib import Path
 
-from celery import current_task
+import redis
+from celery import chain, group
+from celery.exceptions import Ignore
 from pip._internal.utils import temp_dir
 
 from src.auth.models import User
+from src.cache import get_redis
 from src.database import SessionLocal
 from src.media.models import Audio, Video
-from src.media.service import extract_audio_from_video, replace_audio_in_video
-from src.preprocessing.denoiser import process_audio_from_url
+from src.media.service import extract_audio_from_video, probe_media, check_supported_media
+from src.preprocessing.denoiser import process_audio_from_url, resolve_denoise_engine, denoise_audio_locally
 from src.preprocessing.filler import remove_filler_words_from_audio, get_filler_timestamps_from_audio, \
-    remove_filler_words_smooth
+    resolve_filler_detection
+from src.preprocessing.loudness import measure_loudness, compute_gain_db
+from src.preprocessing.pipeline import AudioPipeline, GainStage
+from src.preprocessing.planner import VideoJobPlan, VideoJobRunner
 from src.shorts.ai.service import get_info_for_shorts, extract_json_from_gpt_response, transcribe_audio
-from src.shorts.broll.service import search_broll_videos, download_broll_videos, prepare_broll_insertions, \
+from src.shorts.broll.service import search_broll_for_moments, download_broll_to_library, prepare_broll_insertions, \
     concat_with_broll_ffmpeg, assemble_video_with_broll_overlay, concat_with_broll_ffmpeg_light
 from src.space.service import upload_processed_file_to_space, download_file_from_space, delete_file_from_space
 
+from src.progress import JobProgress, start_tracking, stop_tracking, set_stage
+from src.worker.artifacts import get_artifact_store
+from src.worker.checkpoints import JobCheckpoints
+from src.worker.limits import UserJobSlots
 from src.worker.celery_app import celery_app
 import httpx
 from tempfile import TemporaryDirectory
@@ -26,6 +36,31 @@ import shutil
 import uuid
 import json
 
+# Attempts after the first, each resuming from the last checkpoint.
+VIDEO_TASK_MAX_RETRIES = int(os.getenv("VIDEO_TASK_MAX_RETRIES", "2"))
+VIDEO_TASK_RETRY_DELAY = 30
+# How long a video job's attempt count is kept after its last attempt started.
+VIDEO_TASK_ATTEMPTS_TTL = 24 * 3600
+# How long a job waits before trying again for one of its user's job slots.
+USER_SLOT_WAIT_SECONDS = 20
+# process_audio_task isn't acks_late, so a job whose worker died is never
+# redelivered to release its slot; the slot frees itself just after the task's time limit.
+AUDIO_SLOT_TTL = 720
+
+def _reject_job_options(db, record, kind: str, error: ValueError) -> dict:
+    """
+    Fails a job whose options are invalid. Returned rather than raised:
+    retrying can't fix the options, so no retries are spent on them.
+    """
+    print(f"❌ Job {record.id}: invalid options: {error}")
+    record.status = "FAILED"
+    record.error_message = str(error)
+    db.commit()
+    db.close()
+    JobProgress(kind, record.id, []).finish("FAILED", error=str(error))
+    return {"status": "FAILED", "error": str(error)}
+
+
 async def _process_audio_async(job_id: int, object_name: str, options: dict, user_id: int):
     """
     This is the core async logic. It is NOT a celery task itself.
@@ -36,21 +71,58 @@ async def _process_audio_async(job_id: int, object_name: str, options: dict, use
     if not record:
         return {"status": "FAILED", "error": "Job record not found."}
 
+    try:
+        # Bad option values fail the job before anything is downloaded.
+        denoise_engine = resolve_denoise_engine(options) if options.get("denoise") else None
+        filler_detection = resolve_filler_detection(options)
+    except ValueError as e:
+        return _reject_job_options(db, record, "audio", e)
+
+    stages = ["download"] + (["denoise"] if options.get("denoise") else []) \
+        + (["transcribe", "cut"] if options.get("removeFillers") else []) + ["upload"]
+    progress = JobProgress("audio", job_id, stages)
+    progress_token = start_tracking(progress)
     try:
         record.status = "PROCESSING"
         db.commit()
+        progress.set_status(record.status)
 
         with TemporaryDirectory() as temp_dir:
             # --- Stage 1: Initial Setup ---
             # Download the original file from Spaces. This is our starting point.
+            set_stage("download")
             local_original_path = os.path.join(temp_dir, os.path.basename(object_name))
             download_file_from_space(object_name, local_original_path)
 
+            # Probe once (or reuse the probe stored on the record) and reject unusable uploads early.
+            media_info = probe_media(local_original_path, known=record.media_info)
+            check_supported_media(media_info)
+            record.media_info = media_info.to_dict()
+            db.commit()
+
             # This variable will hold the path to the most recently processed version of the file.
             current_file_path = local_original_path
 
-            # --- Stage 2: Conditional Denoising (Cleanvoice) ---
+            # Loudness of the original, measured once per upload and reused by re-renders.
+            gain_db = 0.0
+            if options.get("normalizeLoudness"):
+                if record.loudness is None:
+                    record.loudness = measure_loudness(local_original_path)
+                    db.commit()
+                gain_db = compute_gain_db(record.loudness)
+                print(f"Loudness normalization: applying {gain_db:+.2f} dB.")
+
+            # --- Stage 2: Conditional Denoising (Cleanvoice or local) ---
             if options.get("denoise"):
+                set_stage("denoise")
+            if denoise_engine == "local":
+                print("Denoise option selected. Processing locally...")
+                current_file_path = denoise_audio_locally(
+                    current_file_path, os.path.join(temp_dir, "audio_denoised.wav")
+                )
+                print(f"Denoising complete. New working file: {current_file_path}")
+
+            elif options.get("denoise"):
                 print("Denoise option selected. Processing with Cleanvoice...")
                 # To process with Cleanvoice, we need a public URL of the ORIGINAL file.
                 original_public_url = f"https://{os.getenv('DO_SPACES_BUCKET_NAME')}.{os.getenv('DO_SPACES_REGION')}.cdn.digitaloceanspaces.com/{object_name}"
@@ -71,14 +143,27 @@ async def _process_audio_async(job_id: int, object_name: str, options: dict, use
             if options.get("removeFillers"):
                 print(f"Remove Fillers option selected. Processing file: {current_file_path}...")
                 # This function runs on the output of the previous step.
-                cleaned_local_path = remove_filler_words_from_audio(current_file_path)
+                set_stage("transcribe")
+                filler_times = get_filler_timestamps_from_audio(
+                    current_file_path, mode=filler_detection
+                )
+                set_stage("cut")
+                # The normalization gain rides along with the cut.
+                cleaned_local_path = remove_filler_words_from_audio(current_file_path, filler_times, gain_db=gain_db)
+                gain_db = 0.0
 
                 current_file_path = cleaned_local_path  # CRUCIAL: Update the working path again
                 print(f"Filler word removal complete. New working file: {current_file_path}")
             else:
                 print("Remove Fillers option not selected. Skipping.")
 
+            if gain_db:
+                current_file_path = AudioPipeline([GainStage(gain_db)]).run(
+                    current_file_path, os.path.join(temp_dir, "audio_normalized.wav")
+                )
+
             # Upload the final version of the file, whatever it may be.
+            set_stage("upload")
             print(f"Uploading final processed file '{current_file_path}' to Spaces...")
             processed_object_name = object_name.replace("originals/", "processed/")
             final_upload_info = upload_processed_file_to_space(current_file_path, processed_object_name)
@@ -87,56 +172,83 @@ async def _process_audio_async(job_id: int, object_name: str, options: dict, use
         record.public_url = final_upload_info["public_url"]
         record.file_path = final_upload_info["public_url"]
         db.commit()
+        progress.finish("COMPLETED", public_url=record.public_url)
         return {"status": "COMPLETED", "public_url": record.public_url}
 
     except Exception as e:
         record.status = "FAILED"
         record.error_message = str(e)
         db.commit()
+        progress.finish("FAILED", error=record.error_message)
         raise e
     finally:
+        stop_tracking(progress_token)
         db.close()
 
-async def _process_video_async(job_id: int, object_name: str, options: dict, user_id: int):
-    """Core async logic for video processing."""
+async def _process_video_async(job_id: int, object_name: str, options: dict, user_id: int,
+                               final_attempt: bool = True):
+    """
+    Core async logic for video processing. Every stage is checkpointed on the
+    record, so a retry (after a time limit, a crash or a lost worker) resumes
+    after the last completed stage instead of starting over from the download.
+    """
     db = SessionLocal()
     record = db.query(Video).filter(Video.id == job_id).first()
     user_id = db.query(User).filter(User.id == user_id).first()
     if not record:
         return {"status": "FAILED", "error": "Job record not found."}
 
+    store = get_artifact_store()
+    # The plan is made up front: its stages are the job's progress stages,
+    # and bad option values fail the job before anything is downloaded.
+    try:
+        plan = VideoJobPlan(options, loudness=record.loudness)
+    except ValueError as e:
+        return _reject_job_options(db, record, "video", e)
+    progress = JobProgress("video", job_id, ["download"] + plan.stages + ["upload"])
+    progress_token = start_tracking(progress)
     try:
         record.status = "PROCESSING"
         db.commit()
+        progress.set_status(record.status)
 
         # --- The entire CORRECT video pipeline we designed before goes here ---
         # It can now use 'await' for things like the Cleanvoice call.
         with TemporaryDirectory() as temp_dir:
+            checkpoints = JobCheckpoints(db, record, store, temp_dir)
+            # Checkpoints of a run with other options don't apply to this one.
+            if record.checkpoints and checkpoints.data("options").get("options") != options:
+                checkpoints.clear()
+            if not checkpoints.done("options"):
+                checkpoints.save("options", None, options=options)
+
             # --- Stage 1: Initial Setup ---
             # 1. Download the original video file from Spaces.
-            original_video_local_path = os.path.join(temp_dir, os.path.basename(object_name))
-            print(f"Downloading original video: {object_name}...")
-            download_file_from_space(object_name, original_video_local_path)
-
-            # 2. Extract the audio track from the video.
-            print("Extracting audio from video...")
-            # The 'temp_dir' is passed as the output directory.
-            extracted_audio_path = extract_audio_from_video(
-                video_path_str=original_video_local_path,
-                output_dir_str=temp_dir
-            )
-
-            # This variable will track the latest version of the audio file through the pipeline.
-            current_audio_path = extracted_audio_path
-            current_video_path = original_video_local_path
-
-            # --- Stage 2: Conditional Denoising on the Extracted Audio ---
-            if options.get("denoise"):
+            if checkpoints.done("download"):
+                original_video_local_path = checkpoints.artifact("download")
+            else:
+                set_stage("download")
+                original_video_local_path = os.path.join(temp_dir, os.path.basename(object_name))
+                print(f"Downloading original video: {object_name}...")
+                download_file_from_space(object_name, original_video_local_path)
+                # A remote store would just hold a second copy of the upload.
+                if store.is_local:
+                    original_video_local_path = checkpoints.save("download", original_video_local_path)
+
+            # Probe once (or reuse the probe stored on the record) and reject unusable uploads early.
+            media_info = probe_media(original_video_local_path, known=record.media_info)
+            check_supported_media(media_info, expect_video=True)
+            record.media_info = media_info.to_dict()
+            db.commit()
+
+            # 2. Run the job's plan: audio is extracted once, processed as a
+            #    single WAV, and the video is rendered in one final pass.
+            async def denoise_with_cleanvoice(audio_path: str) -> str:
                 print("Denoise option selected. Processing extracted audio with Cleanvoice...")
 
                 # To use Cleanvoice, the extracted audio needs its own temporary public URL.
-                temp_audio_object_name = f"users/{user_id}/temp/{os.path.basename(extracted_audio_path)}"
-                temp_audio_info = upload_processed_file_to_space(extracted_audio_path, temp_audio_object_name)
+                temp_audio_object_name = f"users/{user_id}/temp/{os.path.basename(audio_path)}"
+                temp_audio_info = upload_processed_file_to_space(audio_path, temp_audio_object_name)
 
                 # Call Cleanvoice with the temporary URL.
                 processed_audio_url = await process_audio_from_url(temp_audio_info['public_url'], options)
@@ -147,38 +259,29 @@ async def _process_video_async(job_id: int, object_name: str, options: dict, use
                     response = await client.get(processed_audio_url)
                     with open(denoised_local_path, 'wb') as f:
                         f.write(response.content)
+                return denoised_local_path
 
-                current_audio_path = denoised_local_path
-                current_video_path = replace_audio_in_video(
-                    video_path_str=original_video_local_path,
-                    new_audio_path_str=current_audio_path,
-                    output_dir_str=temp_dir
-                )
-                print(f"Denoising complete. New working audio: {current_audio_path}")
+            runner = VideoJobRunner(plan, original_video_local_path, temp_dir,
+                                    remote_denoise=denoise_with_cleanvoice,
+                                    checkpoints=checkpoints)
+            final_video_local_path = await runner.run()
 
-            # --- Stage 3: Conditional Filler Word Removal ---
-            if options.get("removeFillers"):
-                print(f"Remove Fillers option selected. Processing audio: {current_audio_path}...")
-
-                filler_times = get_filler_timestamps_from_audio(current_audio_path)
-
-                current_video_path = remove_filler_words_smooth(current_video_path, filler_times)
-
-                current_audio_path = extract_audio_from_video(
-                    video_path_str=current_video_path,
-                    output_dir_str=temp_dir
-                )
+            record.ffmpeg_passes = runner.ffmpeg_passes
+            # Keep anything probed during the run (e.g. keyframes for smart render).
+            record.media_info = media_info.to_dict()
+            if runner.loudness is not None:
+                record.loudness = runner.loudness
+            db.commit()
 
-                print(f"Filler word removal complete. New working audio: {current_audio_path}")
-
-
-            # Recombine the final processed audio with the original video.
-            print(f"Recombining final audio ('{os.path.basename(current_audio_path)}') with original video...")
-            final_video_local_path = replace_audio_in_video(current_video_path, current_audio_path, temp_dir)
             # Upload the final video file to Spaces.
-            print(f"Uploading final processed video '{os.path.basename(final_video_local_path)}' to Spaces...")
-            processed_object_name = object_name.replace("originals/", "processed/")
-            final_upload_info = upload_processed_file_to_space(final_video_local_path, processed_object_name)
+            if checkpoints.done("upload"):
+                final_upload_info = checkpoints.data("upload")
+            else:
+                set_stage("upload")
+                print(f"Uploading final processed video '{os.path.basename(final_video_local_path)}' to Spaces...")
+                processed_object_name = object_name.replace("originals/", "processed/")
+                final_upload_info = upload_processed_file_to_space(final_video_local_path, processed_object_name)
+                checkpoints.save("upload", None, **final_upload_info)
 
         record.status = "COMPLETED"
         record.public_url = final_upload_info["public_url"]
@@ -186,165 +289,159 @@ async def _process_video_async(job_id: int, object_name: str, options: dict, use
         db.add(record)
         db.commit()
         db.refresh(record)
-        db.commit()
+        # The job is done; its intermediate artifacts aren't needed any more.
+        checkpoints.clear()
+        progress.finish("COMPLETED", public_url=record.public_url)
 
     except Exception as e:
-        record.status = "FAILED"
         record.error_message = str(e)
-        db.commit()
+        if final_attempt:
+            record.status = "FAILED"
+            db.commit()
+            JobCheckpoints(db, record, store, None).clear()
+        else:
+            record.status = "RETRYING"
+            db.commit()
+        progress.finish(record.status, error=record.error_message)
         raise e
     finally:
+        stop_tracking(progress_token)
         db.close()
 
+def start_shorts_pipeline(job_id: int, object_name: str, user_id: int):
+    """
+    Runs the three shorts stages as a Celery chain. Each stage receives the
+    previous one's (small, JSON) return value, so the stages need no shared
+    files to find each other's output and may run on different workers.
+    """
+    return chain(
+        start_shorts_analysis_task.s(job_id, object_name, user_id),
+        download_broll_task.s(job_id),
+        assemble_video_task.s(job_id),
+    ).apply_async()
+
+
+# Progress stages of a shorts job, one per task of the chain.
+SHORTS_STAGES = ["analyze", "broll", "assemble"]
+
+
+def _original_artifact_name(object_name: str) -> str:
+    return "original" + (Path(object_name).suffix or ".mp4")
+
 
 @celery_app.task(bind=True)
-def start_shorts_analysis_task(self, job_id: int, object_name: str, user_id: int):
+def start_shorts_analysis_task(self, job_id: int, object_name: str, user_id: int) -> dict:
     """
     Task 1: Downloads, transcribes, and gets AI suggestions.
     This task is CPU-intensive due to transcription but not for a long duration.
+
+    Returns the moments ({"moments": [...]}) for the B-roll stage.
     """
     db = SessionLocal()
     record = db.query(Video).filter(Video.id == job_id).first()
     if not record:
         print(f"Job {job_id}: Record not found. Aborting.")
-        return
-
-    # Create a unique, persistent staging directory for this job's files.
-    staging_dir = f"/tmp/shushu_job_{job_id}"
-    os.makedirs(staging_dir, exist_ok=True)
+        raise Ignore()
 
+    store = get_artifact_store()
+    progress = JobProgress("video", job_id, SHORTS_STAGES)
+    progress_token = start_tracking(progress)
     try:
         record.status = "ANALYZING"
         db.commit()
+        progress.set_status(record.status)
+        set_stage("analyze")
 
-        # Download original video to the staging directory
-        original_video_path = os.path.join(staging_dir, os.path.basename(object_name))
-        download_file_from_space(object_name, original_video_path)
+        with TemporaryDirectory() as work_dir:
+            # Download original video to the work directory
+            original_video_path = os.path.join(work_dir, os.path.basename(object_name))
+            download_file_from_space(object_name, original_video_path)
 
-        # Extract audio for processing
-        extracted_audio_path = extract_audio_from_video(original_video_path)
+            # Reject unusable uploads before transcription.
+            media_info = probe_media(original_video_path, known=record.media_info)
+            check_supported_media(media_info, expect_video=True)
+            record.media_info = media_info.to_dict()
+            db.commit()
 
-        # Transcribe locally using the pre-loaded Faster Whisper model
-        # transcription_data = transcribe_audio(Path(extracted_audio_path), model_size="base")
+            # Extract audio for processing
+            extracted_audio_path = extract_audio_from_video(original_video_path)
 
-        moments_data = get_info_for_shorts(extracted_audio_path)
-        segments = moments_data.model_dump()
+            # Transcribe locally using the pre-loaded Faster Whisper model
+            # transcription_data = transcribe_audio(Path(extracted_audio_path), model_size="base")
 
-        moments_file_path = os.path.join(staging_dir, "moments.json")
+            moments_data = get_info_for_shorts(extracted_audio_path)
+            segments = moments_data.model_dump()
 
-        with open(moments_file_path, "w", encoding="utf-8") as f:
-            json.dump(segments, f, ensure_ascii=False, indent=2)
+            # With a host-local store, keep the download for the assembly stage.
+            # Otherwise the upload already is in Spaces, and assembly fetches it from there.
+            if store.is_local:
+                store.put_file(job_id, _original_artifact_name(object_name), original_video_path)
 
-        # Update status and trigger the next task in the chain
+        # Update status; the chain hands the moments to the next task
         record.status = "DOWNLOADING_BROLL"
         db.commit()
-        download_broll_task.delay(job_id, staging_dir, moments_file_path)
-        print(f"Job {job_id}: Analysis complete. Triggering B-roll download.")
+        progress.set_status(record.status)
+        print(f"Job {job_id}: Analysis complete. Handing {len(segments['moments'])} moments to B-roll download.")
+        return segments
 
     except Exception as e:
         record.status = "FAILED"
         record.error_message = f"Analysis Failed: {str(e)}"
         db.commit()
-        # Clean up staging directory on failure
-        if os.path.exists(staging_dir):
-            shutil.rmtree(staging_dir)
+        store.delete_job(job_id)
+        progress.finish("FAILED", error=record.error_message)
         raise e
     finally:
+        stop_tracking(progress_token)
         db.close()
 
-def wait_for_valid_json(path, timeout=5.0):
-    start = time.time()
-    while time.time() - start < timeout:
-        if not os.path.exists(path):
-            time.sleep(0.1)
-            continue
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if not content:
-                    raise ValueError("Empty file")
-                data = json.loads(content)
-                if "moments" not in data:
-                    raise KeyError("'moments' key not in data")
-                return data
-        except (json.JSONDecodeError, ValueError, KeyError):
-            time.sleep(0.1)
-    raise TimeoutError(f"moments.json was not valid after {timeout}s")
-
 # ==============================================================================
 #   TASK 2: B-roll Downloading - Handles all network I/O.
 # ==============================================================================
 @celery_app.task(bind=True)
-def download_broll_task(self, job_id: int, staging_dir: str, moments_file_path: str):
+def download_broll_task(self, moments: dict, job_id: int) -> list:
     """
-    Task 2: Reads the moments file, searches Pexels, and downloads B-roll videos.
+    Task 2: Searches Pexels for the moments and downloads B-roll videos.
     This task is network-bound.
+
+    Returns [{"timestamp", "videos": [chosen clip]}] for the assembly stage.
+    The clips are left in this machine's B-roll library, so an assembly on
+    the same machine finds them there.
     """
     db = SessionLocal()
     record = db.query(Video).filter(Video.id == job_id).first()
+    progress = JobProgress("video", job_id, SHORTS_STAGES)
+    progress_token = start_tracking(progress)
     try:
-        moments = wait_for_valid_json(moments_file_path)
-
-        all_video_matches = []
-
-        for item in moments["moments"]:
-            # found_videos = search_broll_videos(item["keywords"])
-            # if found_videos:
-                # Add the moment's timestamp to the video data for later use
-                keywords = item["keywords"]
-                timestamp = item["timestamp"]
-                broll_videos = search_broll_videos(keywords)
-
-                all_video_matches.append({
-                    "timestamp": timestamp,
-                    "keywords": keywords,
-                    "videos": broll_videos  # List of matching videos from Pexels
-                })
-
-        # downloaded_data = asyncio.run(download_broll_videos(all_video_matches, staging_dir))
-
-        downloaded_paths = asyncio.run(download_broll_videos(all_video_matches, staging_dir))
-
-        # Step 3: Save mapping (timestamp <-> broll_path) to a JSON file
-        broll_paths_file = os.path.join(staging_dir, "broll_paths.json")
-        final_broll_info = []
-
-        for i, group in enumerate(all_video_matches):
-            timestamp = group["timestamp"]
-            keywords = group["keywords"]
-
-            # Build same filename as in download function
-            if group["videos"]:
-                keyword = group["videos"][0].get("keyword", "clip").replace(" ", "_")
-                ext = Path(group["videos"][0]["download_url"]).suffix or ".mp4"
-                expected_filename = f"group{i}_{keyword}{ext}"
-                local_path = os.path.join(staging_dir, expected_filename)
-
-                if os.path.exists(local_path):
-                    final_broll_info.append({
-                        "broll_path": local_path,
-                        "timestamp": timestamp
-                    })
-                else:
-                    print(f"⚠️ Expected file not found: {expected_filename}")
-
-        # Step 4: Write to file
-        with open(broll_paths_file, "w", encoding="utf-8") as f:
-            json.dump(final_broll_info, f, indent=2)
-
-        # Step 5: Trigger final assembly
+        set_stage("broll")
+        # Every keyword of every moment is searched concurrently, cached keywords skip the network.
+        all_video_matches = asyncio.run(search_broll_for_moments(moments["moments"]))
+
+        # Clips already in the shared library are reused instead of downloaded again.
+        library_paths = asyncio.run(download_broll_to_library(all_video_matches))
+
+        chosen_clips = []
+        for match, local_path in zip(all_video_matches, library_paths):
+            if local_path is None:
+                if match["videos"]:
+                    print(f"⚠️ No B-roll clip available for {match['timestamp']}")
+                continue
+            chosen_clips.append({"timestamp": match["timestamp"], "videos": match["videos"][:1]})
+
         record.status = "ASSEMBLING"
         db.commit()
-        assemble_video_task.delay(job_id, staging_dir, broll_paths_file)
+        progress.set_status(record.status)
+        return chosen_clips
 
     except Exception as e:
         record.status = "FAILED"
         record.error_message = f"B-roll Download Failed: {str(e)}"
         db.commit()
-        if os.path.exists(staging_dir):
-            shutil.rmtree(staging_dir)
+        get_artifact_store().delete_job(job_id)
+        progress.finish("FAILED", error=record.error_message)
         raise e
     finally:
+        stop_tracking(progress_token)
         db.close()
 
 
@@ -352,27 +449,41 @@ def download_broll_task(self, job_id: int, staging_dir: str, moments_file_path:
 #   TASK 3: Video Assembly - The heavy CPU work.
 # ==============================================================================
 @celery_app.task(bind=True, soft_time_limit=3600, time_limit=3660)
-def assemble_video_task(self, job_id: int, staging_dir: str, broll_paths_file: str):
+def assemble_video_task(self, chosen_clips: list, job_id: int):
     """
-    Task 3: Reads all files from the staging directory and uses FFmpeg
+    Task 3: Collects the original and the chosen B-roll clips and uses FFmpeg
     to assemble the final video. This is a CPU-intensive task.
     """
     db = SessionLocal()
     record = db.query(Video).filter(Video.id == job_id).first()
+    store = get_artifact_store()
+    progress = JobProgress("video", job_id, SHORTS_STAGES)
+    progress_token = start_tracking(progress)
 
     try:
-        with open(broll_paths_file, "r") as f:
-            broll_insertions = json.load(f)
+        set_stage("assemble")
+        with TemporaryDirectory() as work_dir:
+            original_name = _original_artifact_name(record.object_name)
+            if store.is_local:
+                original_video_path = store.fetch(job_id, original_name, work_dir)
+            else:
+                original_video_path = os.path.join(work_dir, original_name)
+                download_file_from_space(record.object_name, original_video_path)
 
-        original_video_path = os.path.join(staging_dir, os.path.basename(record.object_name))
-        final_output_path = os.path.join(staging_dir, "final_video.mp4")
+            # Library hits on the machine that downloaded them; fetched again on any other.
+            library_paths = asyncio.run(download_broll_to_library(chosen_clips))
+            broll_insertions = [
+                {"broll_path": str(path), "timestamp": clip["timestamp"]}
+                for clip, path in zip(chosen_clips, library_paths) if path is not None
+            ]
+            final_output_path = os.path.join(work_dir, "final_video.mp4")
 
-        # Call the high-performance FFmpeg assembly function
-        assemble_video_with_broll_overlay(original_video_path, broll_insertions, final_output_path)
+            # Call the high-performance FFmpeg assembly function
+            assemble_video_with_broll_overlay(original_video_path, broll_insertions, final_output_path)
 
-        # Upload the final video to cloud storage
-        processed_object_name = record.object_name.replace("originals/", "processed/")
-        final_upload_info = upload_processed_file_to_space(final_output_path, processed_object_name)
+            # Upload the final video to cloud storage
+            processed_object_name = record.object_name.replace("originals/", "processed/")
+            final_upload_info = upload_processed_file_to_space(final_output_path, processed_object_name)
 
         # Final database update to mark the job as complete
         record.status = "COMPLETED"
@@ -380,28 +491,139 @@ def assemble_video_task(self, job_id: int, staging_dir: str, broll_paths_file: s
         record.file_path = final_upload_info["public_url"]
         db.commit()
         print(f"Job {job_id}: Assembly complete. Final video uploaded.")
+        progress.finish("COMPLETED", public_url=record.public_url)
 
     except Exception as e:
         record.status = "FAILED"
         record.error_message = f"Assembly Failed: {str(e)}"
         db.commit()
+        progress.finish("FAILED", error=record.error_message)
         raise e
     finally:
+        stop_tracking(progress_token)
         db.close()
-        # Clean up the staging directory now that the job is finished
-        if os.path.exists(staging_dir):
-            print(f"Cleaning up staging directory: {staging_dir}")
-            shutil.rmtree(staging_dir)
+        # Clean up the job's staged files now that the job is finished
+        store.delete_job(job_id)
+
+
+def start_processing_batch(jobs: list[dict]):
+    """
+    Dispatches many processing jobs as one Celery group.
+
+    Each job is {"job_id", "object_name", "options", "user_id", "is_video"}.
+    The group is only a single dispatch; each job still waits for a slot of
+    its user (see _claim_user_slot), so a large batch runs a few at a time.
+    """
+    signatures = []
+    for job in jobs:
+        task = process_video_task if job["is_video"] else process_audio_task
+        signatures.append(task.s(job_id=job["job_id"], object_name=job["object_name"],
+                                 options=job["options"], user_id=job["user_id"]))
+    return group(signatures).apply_async()
+
+
+def _claim_user_slot(task, kind: str, job_id: int, user_id: int, task_kwargs: dict, slot_ttl: int = None) -> bool:
+    """
+    Takes one of the user's MAX_CONCURRENT_JOBS_PER_USER job slots. When they
+    are all taken, the task is sent again to run in USER_SLOT_WAIT_SECONDS
+    and False is returned. The new message carries the current retry count,
+    so waiting neither uses up retries nor resets them.
+    """
+    if UserJobSlots().acquire(user_id, kind, job_id, ttl=slot_ttl):
+        return True
+    print(f"⏳ {kind.capitalize()} job {job_id}: user {user_id} is at their concurrent job limit. Trying again in {USER_SLOT_WAIT_SECONDS}s.")
+    task.apply_async(kwargs=task_kwargs, countdown=USER_SLOT_WAIT_SECONDS, retries=task.request.retries)
+    return False
 
 
 @celery_app.task(bind=True, soft_time_limit=600, time_limit=660)
 def process_audio_task(self, job_id: int, object_name: str, options: dict, user_id: int):
-    return asyncio.run(_process_audio_async(job_id, object_name, options, user_id))
+    task_kwargs = {"job_id": job_id, "object_name": object_name, "options": options, "user_id": user_id}
+    if not _claim_user_slot(self, "audio", job_id, user_id, task_kwargs, slot_ttl=AUDIO_SLOT_TTL):
+        return {"status": "WAITING"}
+    try:
+        return asyncio.run(_process_audio_async(job_id, object_name, options, user_id))
+    finally:
+        UserJobSlots().release(user_id, "audio", job_id)
 
 
-@celery_app.task(bind=True, soft_time_limit=3600, time_limit=3660)
+def _video_attempts_key(job_id: int) -> str:
+    return f"attempts:video:{job_id}"
+
+
+def _count_video_attempt(job_id: int, retries: int) -> int:
+    """
+    Counts a started attempt of a video job (1 for the first). Unlike
+    request.retries, this also counts redeliveries after the worker died
+    (OOM kill, segfault), which Celery doesn't see as retries.
+    Falls back to `retries` + 1 when Redis is unavailable.
+    """
+    key = _video_attempts_key(job_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(key)
+        pipe.expire(key, VIDEO_TASK_ATTEMPTS_TTL)
+        return max(pipe.execute()[0], retries + 1)
+    except redis.RedisError as e:
+        print(f"⚠️ Could not count the attempts of job {job_id}: {e}")
+        return retries + 1
+
+
+def _forget_video_attempts(job_id: int):
+    try:
+        get_redis().delete(_video_attempts_key(job_id))
+    except redis.RedisError:
+        pass
+
+
+def _give_up_video_job(job_id: int, attempts: int):
+    """Marks a job FAILED whose every attempt so far took its worker down with it."""
+    message = f"Processing stopped the worker in each of {attempts} attempts."
+    print(f"❌ Job {job_id}: {message} Giving up.")
+    db = SessionLocal()
+    try:
+        record = db.query(Video).filter(Video.id == job_id).first()
+        if record:
+            record.status = "FAILED"
+            record.error_message = message
+            db.commit()
+            JobCheckpoints(db, record, get_artifact_store(), None).clear()
+    finally:
+        db.close()
+    JobProgress("video", job_id, []).finish("FAILED", error=message)
+
+
+# acks_late + reject_on_worker_lost: a job whose worker died is redelivered,
+# and resumes from its checkpoints like any other retry. Redeliveries count
+# against max_retries too (see _count_video_attempt), so a job that crashes
+# the worker every time ends FAILED instead of blocking the render queue.
+@celery_app.task(bind=True, soft_time_limit=3600, time_limit=3660, acks_late=True,
+                 reject_on_worker_lost=True, max_retries=VIDEO_TASK_MAX_RETRIES)
 def process_video_task(self, job_id: int, object_name: str, options: dict, user_id: int):
-    return asyncio.run(_process_video_async(job_id, object_name, options, user_id))
+    task_kwargs = {"job_id": job_id, "object_name": object_name, "options": options, "user_id": user_id}
+    if not _claim_user_slot(self, "video", job_id, user_id, task_kwargs):
+        return {"status": "WAITING"}
+    attempt = _count_video_attempt(job_id, self.request.retries)
+    if attempt > self.max_retries + 1:
+        # Only a redelivery gets here: the final attempt never got to finish.
+        UserJobSlots().release(user_id, "video", job_id)
+        _forget_video_attempts(job_id)
+        _give_up_video_job(job_id, attempt - 1)
+        return {"status": "FAILED"}
+
+    final_attempt = attempt > self.max_retries
+    try:
+        result = asyncio.run(_process_video_async(job_id, object_name, options, user_id, final_attempt))
+        _forget_video_attempts(job_id)
+        return result
+    except Exception as e:
+        if final_attempt:
+            _forget_video_attempts(job_id)
+            raise
+        raise self.retry(exc=e, countdown=VIDEO_TASK_RETRY_DELAY)
+    finally:
+        # A retry waits for a slot again like any other job.
+        UserJobSlots().release(user_id, "video", job_id)
 
 
 # @celery_app.task(bind=True, soft_time_limit=3600, time_limit=3660)
@@ -0,0 +1,116 @@
+"""
+Benchmarks align_transcripts against the original quadratic implementation
+on synthetic base/medium transcripts.
+
+    python -m test.align_benchmark
+    python -m test.align_benchmark --sizes 10000 50000 --reference-limit 10000
+"""
+import argparse
+import random
+import time
+
+from src.preprocessing.filler import align_transcripts
+
+VOCABULARY = [
+    "the", "and", "so", "we", "you", "know", "i", "think", "that", "is",
+    "podcast", "episode", "today", "really", "people", "about", "what", "just",
+    "um", "uh", "like", "yeah", "basically", "mm",
+]
+
+
+def align_transcripts_reference(base_words, medium_words, time_tolerance=0.5):
+    """The original O(n·m) alignment, kept here as the correctness baseline."""
+    aligned = []
+    used_indices = set()
+
+    for bw in base_words:
+        word = bw["word"].lower()
+        best_match = None
+        best_diff = float("inf")
+
+        for idx, mw in enumerate(medium_words):
+            if idx in used_indices:
+                continue
+            if mw["word"].lower() != word:
+                continue
+
+            time_diff = abs(bw["start"] - mw["start"])
+            if time_diff < best_diff and time_diff <= time_tolerance:
+                best_diff = time_diff
+                best_match = (idx, mw)
+
+        if best_match:
+            idx, mw = best_match
+            used_indices.add(idx)
+            aligned.append({
+                "word": word,
+                "start": mw["start"],
+                "end": mw["end"]
+            })
+        else:
+            aligned.append(bw)
+
+    return aligned
+
+
+def make_transcripts(n_words: int, seed: int = 0) -> tuple[list, list]:
+    """
+    Builds a base transcript and a medium transcript that mostly agrees with it:
+    timestamps jitter by up to ±0.4s, and some words are dropped, inserted or
+    recognised differently, as happens between Whisper model sizes.
+    """
+    rng = random.Random(seed)
+    base, medium = [], []
+    t = 0.0
+    for _ in range(n_words):
+        word = rng.choice(VOCABULARY)
+        duration = rng.uniform(0.1, 0.6)
+        base.append({"word": word.capitalize() if rng.random() < 0.1 else word,
+                     "start": round(t, 4), "end": round(t + duration, 4)})
+
+        roll = rng.random()
+        if roll < 0.05:
+            pass  # medium dropped the word
+        else:
+            medium_word = rng.choice(VOCABULARY) if roll < 0.1 else word
+            jitter = rng.uniform(-0.4, 0.4)
+            start = max(0.0, t + jitter)
+            medium.append({"word": medium_word, "start": round(start, 4),
+                           "end": round(start + duration, 4)})
+            if rng.random() < 0.03:
+                extra = start + duration / 2
+                medium.append({"word": rng.choice(VOCABULARY), "start": round(extra, 4),
+                               "end": round(extra + 0.2, 4)})
+        t += duration + rng.uniform(0.0, 0.3)
+    return base, medium
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 25_000, 50_000])
+    parser.add_argument("--reference-limit", type=int, default=10_000,
+                        help="Skip the quadratic reference above this many words.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'words':>8} {'banded (s)':>12} {'reference (s)':>14} {'speedup':>9}  identical")
+    for size in args.sizes:
+        base, medium = make_transcripts(size, seed=args.seed)
+        fast, fast_time = _timed(align_transcripts, base, medium)
+
+        if size <= args.reference_limit:
+            reference, reference_time = _timed(align_transcripts_reference, base, medium)
+            print(f"{size:>8} {fast_time:>12.3f} {reference_time:>14.3f} "
+                  f"{reference_time / fast_time:>8.0f}x  {fast == reference}")
+        else:
+            print(f"{size:>8} {fast_time:>12.3f} {'skipped':>14} {'-':>9}  -")
+
+
+if __name__ == "__main__":
+    main()